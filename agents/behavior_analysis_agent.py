@@ -1,52 +1,191 @@
 import os
+import sys
 import json
 import datetime
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
 
-# Set up path to behavior log
+try:
+    import fcntl  # POSIX only; elsewhere writers are serialized per process
+except ImportError:
+    fcntl = None
+
+# Set up path to behavior log (shared with the user profile agent)
 BASE_DIR = Path(__file__).resolve().parent
-DATA_DIR = BASE_DIR / "data"
-BEHAVIOR_LOG = DATA_DIR / "behavior_log.json"
+DATA_DIR = BASE_DIR.parent / "data"
+BEHAVIOR_LOG = DATA_DIR / "behavior_log.jsonl"
+LOCK_FILE = DATA_DIR / "behavior_log.lock"
+# JSON array the agent used to rewrite on every event, before the JSON Lines log
+LEGACY_LOG = BASE_DIR / "data" / "behavior_log.json"
+
+# The active segment is rotated to behavior_log.<time_ns>.jsonl once it reaches this size
+MAX_SEGMENT_BYTES = 64 * 1024 * 1024
+
+VALID_EVENTS = {"view", "click", "buy"}
 
 # Ensure data directory exists
 os.makedirs(DATA_DIR, exist_ok=True)
 
-def log_behavior(user_id, product_id, event_type):
-    timestamp = datetime.datetime.now().isoformat()
-    behavior_entry = {
+_thread_lock = threading.Lock()
+
+@contextmanager
+def _log_lock():
+    # Threads in this process + other processes (via flock on a sidecar lock file)
+    with _thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(LOCK_FILE, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+def _rotate_if_needed():
+    if BEHAVIOR_LOG.exists() and BEHAVIOR_LOG.stat().st_size >= MAX_SEGMENT_BYTES:
+        rotated = DATA_DIR / f"behavior_log.{time.time_ns():020d}.jsonl"
+        os.replace(BEHAVIOR_LOG, rotated)
+
+def segment_paths():
+    # Rotated segments oldest first, then the active one
+    rotated = sorted(DATA_DIR.glob("behavior_log.*.jsonl"))
+    return rotated + ([BEHAVIOR_LOG] if BEHAVIOR_LOG.exists() else [])
+
+def make_entry(user_id, product_id, event_type, timestamp=None):
+    return {
         "user_id": str(user_id),
         "product_id": str(product_id),
         "event_type": event_type,
-        "timestamp": timestamp,
+        "timestamp": timestamp or datetime.datetime.now().isoformat(),
     }
 
-    # Load existing logs
-    if BEHAVIOR_LOG.exists():
-        try:
-            with open(BEHAVIOR_LOG, "r") as f:
-                logs = json.load(f)
-        except json.JSONDecodeError:
-            logs = []
-    else:
-        logs = []
+def _make_entries(events):
+    return [
+        make_entry(e["user_id"], e["product_id"], e["event_type"], e.get("timestamp"))
+        if isinstance(e, dict) else make_entry(*e)
+        for e in events
+    ]
+
+def _append(entries):
+    # Caller holds _log_lock()
+    data = "".join(json.dumps(entry) + "\n" for entry in entries).encode("utf-8")
+    _rotate_if_needed()
+    fd = os.open(BEHAVIOR_LOG, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+    finally:
+        os.close(fd)
+
+def log_behaviors(events):
+    """Append a batch of events (dicts or (user_id, product_id, event_type) tuples) in one write."""
+    entries = _make_entries(events)
+    if not entries:
+        return []
+    with _log_lock():
+        _append(entries)
+    return entries
+
+def log_behavior(user_id, product_id, event_type):
+    entry = log_behaviors([(user_id, product_id, event_type)])[0]
+    print(f"[LOGGED] {event_type.upper()} | User: {user_id} | Product: {product_id} | Time: {entry['timestamp']}")
+
+def iter_behaviors():
+    """Stream logged events oldest first without loading whole segments."""
+    for path in segment_paths():
+        with open(path, "r") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break  # a write still in progress
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"⚠️ Skipping corrupt behavior log line in {path.name}")
 
-    logs.append(behavior_entry)
+def _segment_id(path):
+    # inode survives the rename on rotation; the first line guards against inode reuse
+    with open(path, "rb") as f:
+        head = f.readline()
+    return {"inode": path.stat().st_ino, "head": hashlib.sha1(head).hexdigest()}
 
-    # Save back to file
-    with open(BEHAVIOR_LOG, "w") as f:
-        json.dump(logs, f, indent=2)
+def read_behaviors(watermark=None, max_events=None):
+    """Return (events, watermark) for complete events logged after ``watermark``.
 
-    print(f"[LOGGED] {event_type.upper()} | User: {user_id} | Product: {product_id} | Time: {timestamp}")
+    A watermark is {"inode", "head", "offset"}: the segment it points into (robust to
+    rotation) and the byte offset just past the last consumed line.
+    """
+    segments = segment_paths()
+    start, offset = 0, 0
+    if watermark:
+        for i, path in enumerate(segments):
+            segment_id = _segment_id(path)
+            if segment_id["inode"] == watermark["inode"] and segment_id["head"] == watermark["head"]:
+                start, offset = i, watermark["offset"]
+                break
+
+    events = []
+    new_watermark = watermark
+    for path in segments[start:]:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # a write still in progress
+                offset += len(line)
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    print(f"⚠️ Skipping corrupt behavior log line in {path.name}")
+                if max_events is not None and len(events) >= max_events:
+                    break
+        # Only point at a segment once its first line is complete (its ID is then stable)
+        if offset:
+            new_watermark = {**_segment_id(path), "offset": offset}
+        if max_events is not None and len(events) >= max_events:
+            break
+        offset = 0
+    return events, new_watermark
+
+def import_legacy_log(path=LEGACY_LOG):
+    """Append the events of the old JSON-array log to the JSON Lines log once, then rename it to *.imported."""
+    path = Path(path)
+    # One lock for read, append and rename, so concurrent imports cannot both append the events
+    with _log_lock():
+        if not path.exists():
+            return 0
+        with open(path, "r") as f:
+            events = json.load(f)
+        entries = _make_entries(sorted(events, key=lambda e: e.get("timestamp") or ""))
+        if entries:
+            _append(entries)
+        os.replace(path, path.with_name(path.name + ".imported"))
+    print(f"✅ Imported {len(events)} events from {path} into {BEHAVIOR_LOG.name}")
+    return len(events)
+
+def clear_behaviors():
+    with _log_lock():
+        for path in segment_paths():
+            path.unlink()
 
 # CLI Interaction
 if __name__ == "__main__":
+    if "--import-legacy" in sys.argv:
+        import_legacy_log()
+        sys.exit(0)
+
     print("🧠 Behavior Logger")
     try:
         user_id = int(input("Enter User ID: "))
         product_id = int(input("Enter Product ID: "))
         event_type = input("Enter Event Type (e.g., view, click, buy): ").strip().lower()
 
-        if event_type not in {"view", "click", "buy"}:
+        if event_type not in VALID_EVENTS:
             raise ValueError("Unsupported event type.")
 
         log_behavior(user_id, product_id, event_type)
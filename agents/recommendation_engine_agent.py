@@ -1,60 +1,73 @@
-import json
-import numpy as np
+import sys
 from pathlib import Path
 
 # Set up paths
 BASE_DIR = Path(__file__).resolve().parent
 DATA_DIR = BASE_DIR.parent / "data"
 
-USERS_FILE = DATA_DIR / "users_with_embeddings.json"
-PRODUCTS_FILE = DATA_DIR / "products_with_embeddings.json"
-RECOMMENDATIONS_FILE = DATA_DIR / "recommendations.json"
+# Shared modules live at the project root
+sys.path.append(str(BASE_DIR.parent))
+from ann_index import load_store_index
+from candidate_filters import CandidateFilter
+from embedding_store import load_store
+from incremental import merge_recommendations, plan_rerank, save_state, users_to_recompute
+import profiling
+from recommendations_io import RECOMMENDATIONS_PATH, RecommendationsWriter, slim_item
+from scoring import ScoringEngine
 
 TOP_K = 5  # number of top recommendations per user
 
-def load_json(path):
-    with open(path, "r") as f:
-        return json.load(f)
+def iter_user_recommendations(engine, user_store, user_rows, candidates=None, batch_size=1024):
+    # Top K per user through the ANN index (exact scan for small catalogs), a block at a time
+    users = user_store.records
+    product_ids = engine.ids
+    for start in range(0, len(user_rows), batch_size):
+        block = user_rows[start:start + batch_size]
+        rows, scores = engine.search(user_store.vectors[block], TOP_K, candidates=candidates)
+        for user_row, product_rows, product_scores in zip(block, rows, scores):
+            user = users[user_row]
+            yield {
+                "user_id": user["user_id"],
+                "name": user["name"],
+                "recommendations": [
+                    slim_item(product_ids[row], score) for row, score in zip(product_rows, product_scores) if row >= 0
+                ],
+            }
 
-def cosine_similarity(a, b):
-    a, b = np.array(a), np.array(b)
-    return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
-
-def recommend_products():
+def recommend_products(full=False, output_path=RECOMMENDATIONS_PATH):
     print("🤖 Running Recommendation Engine...")
 
-    users = load_json(USERS_FILE)
-    products = load_json(PRODUCTS_FILE)
-
-    all_recommendations = []
-
-    for user in users:
-        user_id = user["user_id"]
-        user_vector = user["embedding"]
-
-        # Compute similarity with all products
-        scored_products = []
-        for product in products:
-            product_vector = product["embedding"]
-            score = cosine_similarity(user_vector, product_vector)
-            scored_products.append((product, score))
-
-        # Sort by score (descending) and take top K
-        top_products = sorted(scored_products, key=lambda x: x[1], reverse=True)[:TOP_K]
+    with profiling.stage("load"):
+        user_store = load_store("users")
+        product_store = load_store("products")
+        engine = ScoringEngine.from_store(product_store, index=load_store_index("products", product_store))
+        # Out-of-stock products are filtered before scoring (None when everything is in stock)
+        candidates = CandidateFilter().rows(engine)
 
-        # Prepare output
-        recommendations = [p[0] for p in top_products]
-        all_recommendations.append({
-            "user_id": user_id,
-            "name": user["name"],
-            "recommendations": recommendations
-        })
+    # Only users whose profile changed or whose top K a catalog change can affect
+    with profiling.stage("plan", items=len(user_store)):
+        plan = plan_rerank(output_path, user_store, product_store, "agent", TOP_K, full=full, candidates=candidates)
+        user_rows = users_to_recompute(plan, output_path, user_store, engine, candidates=candidates)
+    if plan.full:
+        print(f"🔁 Full run ({plan.reason})")
+    else:
+        print(f"♻️ Incremental run: {len(user_rows)} of {len(user_store)} users to recompute "
+              f"({len(plan.dirty_rows)} changed, {len(plan.added_rows)} new/changed products)")
 
-    # Save to file
-    with open(RECOMMENDATIONS_FILE, "w") as f:
-        json.dump(all_recommendations, f, indent=2)
+    # Scoring is streamed straight into the writer, so "write" includes it (see the nested score/sort stages)
+    recomputed = iter_user_recommendations(engine, user_store, user_rows, candidates)
+    with profiling.stage("write", items=len(user_rows)), RecommendationsWriter(output_path) as writer:
+        if plan.full:
+            writer.write_all(recomputed)
+        else:
+            writer.write_all(merge_recommendations(output_path, list(recomputed), user_store))
+    save_state(output_path, plan, product_store, user_store)
 
-    print(f"✅ Saved top {TOP_K} recommendations for {len(users)} users to recommendations.json")
+    print(f"✅ Saved top {TOP_K} recommendations for {writer.count} users to {Path(output_path).name}")
 
 if __name__ == "__main__":
-    recommend_products()
+    profiling.start("recommendation_engine_agent", profiling.argv_modes())
+    try:
+        recommend_products(full="--full" in sys.argv)
+    finally:
+        profiling.finish()
@@ -1,77 +1,183 @@
-import json
+import os
+import sys
+import time
 import numpy as np
-from collections import defaultdict
+from datetime import datetime
 from pathlib import Path
 
 # Dynamically resolve correct data directory relative to this script
 BASE_DIR = Path(__file__).resolve().parent
 DATA_DIR = BASE_DIR.parent / "data"
 
-# Paths to data files
-BEHAVIOR_LOG = DATA_DIR / "behavior_log.json"
-USERS_FILE = DATA_DIR / "users_with_embeddings.json"
-PRODUCTS_FILE = DATA_DIR / "products_with_embeddings.json"
-
-# Weight for blending old + new embedding
-BLEND_WEIGHT = 0.6  # 60% old, 40% from new behavior
-
-def load_json(path):
-    with open(path, "r") as f:
-        return json.load(f)
-
-def save_json(path, data):
-    with open(path, "w") as f:
-        json.dump(data, f, indent=2)
-
-def update_user_profiles():
-    if not BEHAVIOR_LOG.exists():
-        print("❌ No behavior log found. Nothing to update.")
-        return
-
-    print("🔁 Updating user profiles based on behavior log...")
-
-    behaviors = load_json(BEHAVIOR_LOG)
-    users = load_json(USERS_FILE)
-    products = load_json(PRODUCTS_FILE)
+# Shared modules live at the project root
+sys.path.append(str(BASE_DIR.parent))
+from agents.behavior_analysis_agent import import_legacy_log, read_behaviors
+from embedding_store import load_column, load_manifest, load_store, recover_pending, save_store, update_rows
+import profiling
+
+def _parse_weights(spec):
+    # "view=1,click=2,buy=5" -> {"view": 1.0, "click": 2.0, "buy": 5.0}
+    pairs = (item.split("=", 1) for item in spec.split(",") if item.strip())
+    return {event.strip(): float(weight) for event, weight in pairs}
+
+# How much each event type pulls the profile towards the product (override with PROFILE_EVENT_WEIGHTS)
+EVENT_WEIGHTS = _parse_weights(os.getenv("PROFILE_EVENT_WEIGHTS", "view=1,click=2,buy=5"))
+
+# An event's weight halves every HALF_LIFE_HOURS (override with PROFILE_HALF_LIFE_HOURS)
+HALF_LIFE_HOURS = float(os.getenv("PROFILE_HALF_LIFE_HOURS", "72"))
+
+# Weight given to a profile that has no behavior history yet (its text embedding)
+PRIOR_WEIGHT = 3.0
+
+# Events consumed per micro-batch, and seconds between polls in --follow mode
+MICRO_BATCH_EVENTS = 50000
+POLL_INTERVAL = 5.0
+
+def _event_time(entry, default):
+    try:
+        return datetime.fromisoformat(entry["timestamp"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return default
+
+def _decay(elapsed_seconds):
+    return 0.5 ** (np.maximum(elapsed_seconds, 0.0) / (HALF_LIFE_HOURS * 3600.0))
+
+def _decayed_update(user_vectors, mass, updated_at, norms, user_rows, product_vectors, weights, times):
+    """Exponentially-decayed weighted mean per touched user, brought forward to their latest event.
+
+    Each profile is the running statistic sum(w_i * decay(t - t_i) * p_i) / sum(w_i * decay(t - t_i)),
+    stored as its direction, its length (``norms``; the store keeps unit vectors) and its decayed
+    total weight (``mass``), so folding in new events is O(1) per event, never re-reads history and
+    gives the same profile however the events are split into batches.
+    """
+    touched, inverse = np.unique(user_rows, return_inverse=True)
+    latest = np.full(len(touched), -np.inf)
+    np.maximum.at(latest, inverse, times)
+    earliest = np.full(len(touched), np.inf)
+    np.minimum.at(earliest, inverse, times)
+
+    old_mass = np.where(np.isnan(mass[touched]), PRIOR_WEIGHT, mass[touched])
+    # A profile without history starts decaying at its first event
+    old_time = np.where(np.isnan(updated_at[touched]), earliest, updated_at[touched])
+    # Late events are decayed to the profile's time instead of moving it back
+    now = np.maximum(latest, old_time)
+    old_mass = old_mass * _decay(now - old_time)
+
+    event_weights = weights * _decay(now[inverse] - times)
+    sums = np.zeros((len(touched), product_vectors.shape[1]), dtype=np.float64)
+    np.add.at(sums, inverse, event_weights[:, None] * product_vectors)
+    new_mass = np.bincount(inverse, weights=event_weights, minlength=len(touched))
+
+    # Undo the store's normalization to get back the actual mean (the text-embedding prior has length 1)
+    old_norm = np.where(np.isnan(norms[touched]), 1.0, norms[touched])
+    old_means = np.asarray(user_vectors[touched], dtype=np.float64) * old_norm[:, None]
+
+    total_mass = old_mass + new_mass
+    vectors = (old_mass[:, None] * old_means + sums) / total_mass[:, None]
+    return touched, vectors, total_mass, now, np.linalg.norm(vectors, axis=1)
+
+def update_user_profiles(user_store=None, product_store=None, max_events=MICRO_BATCH_EVENTS):
+    """Fold behavior logged since the stored watermark into the touched users' embeddings.
+
+    Returns the number of events consumed. Vectors and the new watermark are committed
+    together, so an interrupted run neither loses nor double-counts events.
+    """
+    recover_pending("users")
+    user_store = user_store or load_store("users")
+    product_store = product_store or load_store("products")
+
+    if user_store.version is None:
+        # update_rows patches a store in place; move legacy JSON users into one first
+        save_store("users", user_store.records, user_store.vectors)
+        user_store = load_store("users")
+
+    watermark = user_store.manifest.get("behavior_watermark")
+    with profiling.stage("read") as read:
+        events, new_watermark = read_behaviors(watermark, max_events)
+        read.add(len(events))
+    if not events:
+        return 0
 
     # Ensure all keys are strings for matching
-    user_dict = {str(user["user_id"]): user for user in users}
-    product_dict = {str(product["id"]): product for product in products}
-
-    # Debug print to confirm loaded IDs
-    print("👥 Available user IDs:", list(user_dict.keys()))
-    print("📦 Available product IDs:", list(product_dict.keys()))
-
-    # Map user → list of product embeddings
-    user_behavior_vectors = defaultdict(list)
-
-    for entry in behaviors:
-        uid = str(entry["user_id"])
-        pid = str(entry["product_id"])
-
-        if uid in user_dict and pid in product_dict:
-            embedding = product_dict[pid]["embedding"]
-            user_behavior_vectors[uid].append(embedding)
-
-    updated_count = 0
-
-    for uid, vectors in user_behavior_vectors.items():
-        user = user_dict[uid]
-        old_vector = np.array(user["embedding"])
-        new_vector = np.mean(np.array(vectors), axis=0)
-
-        # Blend old and new (to preserve history)
-        blended_vector = (BLEND_WEIGHT * old_vector) + ((1 - BLEND_WEIGHT) * new_vector)
-        user["embedding"] = blended_vector.tolist()
-        updated_count += 1
-
-    # Save updated users
-    save_json(USERS_FILE, list(user_dict.values()))
-    print(f"✅ Updated embeddings for {updated_count} users.")
-
-    # Clear the behavior log
-    BEHAVIOR_LOG.write_text("[]")
-    print("🧹 Cleared behavior log.\n")
+    user_dict = {str(user_id): row for user_id, row in user_store.row_of.items()}
+    product_dict = {str(product_id): row for product_id, row in product_store.row_of.items()}
+
+    now = time.time()
+    user_rows, product_rows, weights, times = [], [], [], []
+    with profiling.stage("parse", items=len(events)):
+        for entry in events:
+            user_row = user_dict.get(str(entry["user_id"]))
+            product_row = product_dict.get(str(entry["product_id"]))
+            weight = EVENT_WEIGHTS.get(entry.get("event_type"), 0.0)
+            if user_row is not None and product_row is not None and weight > 0:
+                user_rows.append(user_row)
+                product_rows.append(product_row)
+                weights.append(weight)
+                times.append(_event_time(entry, now))
+
+    with profiling.stage("aggregate", items=len(user_rows)):
+        if user_rows:
+            touched, blended, mass, updated_at, norms = _decayed_update(
+                user_store.vectors,
+                load_column("users", "behavior_mass"),
+                load_column("users", "behavior_updated_at"),
+                load_column("users", "behavior_norm"),
+                np.asarray(user_rows),
+                np.asarray(product_store.vectors[product_rows], dtype=np.float64),
+                np.asarray(weights),
+                np.asarray(times),
+            )
+        else:
+            touched, blended = np.empty(0, dtype=np.int64), np.empty((0, user_store.vectors.shape[1]), dtype=np.float32)
+            mass, updated_at, norms = np.empty(0), np.empty(0), np.empty(0)
+
+    with profiling.stage("write", items=len(touched)):
+        update_rows(
+            "users", touched, blended,
+            extra={"behavior_watermark": new_watermark},
+            columns={
+                "behavior_mass": mass,
+                "behavior_updated_at": updated_at,
+                "behavior_norm": norms,
+                # Picked up by the incremental re-rank (incremental.py) to find users to recompute
+                "profile_updated_at": np.full(len(touched), time.time()),
+            },
+        )
+    skipped = len(events) - len(user_rows)
+    print(f"✅ Consumed {len(events)} events ({skipped} skipped: unknown IDs or zero weight), updated {len(touched)} users.")
+    return len(events)
+
+def run_continuously(interval=POLL_INTERVAL):
+    print(f"🔁 Following the behavior log every {interval:.0f}s (Ctrl+C to stop)...")
+    product_store = load_store("products")
+    try:
+        while True:
+            # Drain the backlog in micro-batches, then wait for new events
+            while update_user_profiles(product_store=product_store):
+                pass
+            time.sleep(interval)
+            manifest = load_manifest("products")
+            if manifest and manifest.get("version") != product_store.version:
+                product_store = load_store("products")
+    except KeyboardInterrupt:
+        print("\n👋 Stopped.")
 
 if __name__ == "__main__":
-    update_user_profiles()
+    profiling.start("user_profile_agent", profiling.argv_modes())
+    try:
+        # Events still in the pre-JSON Lines log would otherwise never be read
+        import_legacy_log()
+        if "--follow" in sys.argv:
+            run_continuously()
+        else:
+            print("🔁 Updating user profiles based on behavior log...")
+            total = 0
+            while True:
+                consumed = update_user_profiles()
+                if not consumed:
+                    break
+                total += consumed
+            if not total:
+                print("✅ No new behavior since the last update.")
+    finally:
+        profiling.finish()
@@ -0,0 +1,249 @@
+import argparse
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from embedding_store import load_store, store_path
+from scoring import normalize_rows, top_k_indices
+
+# === Defaults === #
+# Below this many vectors an exact scan is already fast, so the index just brute-forces
+BRUTE_FORCE_THRESHOLD = 5000
+DEFAULT_NPROBE = 8            # lists scanned per query: the recall/latency knob
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLES_PER_LIST = 64  # training sample size per inverted list
+ASSIGN_BATCH_SIZE = 4096
+INDEX_FILE = "ivf_index.npz"
+
+
+def default_n_lists(n_vectors):
+    return max(1, int(np.sqrt(n_vectors)))
+
+
+def _assign(vectors, centroids):
+    # Nearest centroid (by inner product on unit vectors) for each row, in blocks
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_BATCH_SIZE):
+        block = vectors[start:start + ASSIGN_BATCH_SIZE]
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def train_centroids(vectors, n_lists, iterations=KMEANS_ITERATIONS, seed=0):
+    # Spherical k-means on a sample of the catalog
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), n_lists * KMEANS_SAMPLES_PER_LIST)
+    sample = normalize_rows(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))])
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        counts = np.bincount(assignments, minlength=n_lists)
+        # Re-seed empty lists from random sample points so every list stays usable
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+class IVFIndex:
+    """IVF-flat index over unit vectors: k-means coarse lists, exact scoring inside probed lists.
+
+    Until the index holds ``brute_force_threshold`` vectors it keeps one flat matrix and
+    answers exactly; crossing the threshold (at build time or through ``add``) trains it.
+    """
+
+    def __init__(self, dim, nprobe=DEFAULT_NPROBE, brute_force_threshold=BRUTE_FORCE_THRESHOLD, n_lists=None):
+        self.dim = dim
+        self.nprobe = nprobe
+        self.brute_force_threshold = brute_force_threshold
+        self.n_lists = n_lists
+        self.version = None
+        self.centroids = None
+        self.list_vectors = []
+        self.list_ids = []
+        # Flat storage for the untrained / brute-force state
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self.ids = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        if self.trained:
+            return sum(len(ids) for ids in self.list_ids)
+        return len(self.ids)
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    @classmethod
+    def build(cls, vectors, ids=None, **kwargs):
+        vectors = normalize_rows(vectors)
+        index = cls(vectors.shape[1], **kwargs)
+        index.add(vectors, np.arange(len(vectors)) if ids is None else ids)
+        return index
+
+    def add(self, vectors, ids):
+        """Insert newly embedded vectors; ``ids`` are the rows callers want back from search."""
+        vectors = normalize_rows(vectors).reshape(-1, self.dim)
+        ids = np.asarray(ids, dtype=np.int64)
+        if not self.trained:
+            self.vectors = np.concatenate([self.vectors, vectors])
+            self.ids = np.concatenate([self.ids, ids])
+            if len(self.ids) >= self.brute_force_threshold:
+                self._train()
+            return
+
+        assignments = _assign(vectors, self.centroids)
+        for list_no in np.unique(assignments):
+            members = assignments == list_no
+            self.list_vectors[list_no] = np.concatenate([self.list_vectors[list_no], vectors[members]])
+            self.list_ids[list_no] = np.concatenate([self.list_ids[list_no], ids[members]])
+
+    def _train(self):
+        vectors, ids = self.vectors, self.ids
+        n_lists = min(self.n_lists or default_n_lists(len(vectors)), len(vectors))
+        self.centroids = train_centroids(vectors, n_lists)
+        assignments = _assign(vectors, self.centroids)
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(n_lists + 1))
+        self.list_vectors = [vectors[order[a:b]] for a, b in zip(bounds[:-1], bounds[1:])]
+        self.list_ids = [ids[order[a:b]] for a, b in zip(bounds[:-1], bounds[1:])]
+        self.vectors = np.empty((0, self.dim), dtype=np.float32)
+        self.ids = np.empty(0, dtype=np.int64)
+
+    def row_vectors(self):
+        # All stored (ids, vectors) regardless of layout
+        if not self.trained:
+            return self.ids, self.vectors
+        return np.concatenate(self.list_ids), np.concatenate(self.list_vectors)
+
+    def search(self, queries, k, nprobe=None):
+        """Return (ids, scores) shaped (n_queries, k); missing slots hold id -1 and score -inf."""
+        queries = normalize_rows(queries)
+        result_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        result_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+
+        if not self.trained:
+            scores = queries @ self.vectors.T
+            best = top_k_indices(scores, k)
+            result_ids[:, :best.shape[1]] = self.ids[best]
+            result_scores[:, :best.shape[1]] = np.take_along_axis(scores, best, axis=1)
+            return result_ids, result_scores
+
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        probes = top_k_indices(queries @ self.centroids.T, nprobe)
+        for q, query in enumerate(queries):
+            candidate_scores = np.concatenate([self.list_vectors[l] @ query for l in probes[q]])
+            candidate_ids = np.concatenate([self.list_ids[l] for l in probes[q]])
+            if not len(candidate_ids):
+                continue
+            best = top_k_indices(candidate_scores[None, :], k)[0]
+            result_ids[q, :len(best)] = candidate_ids[best]
+            result_scores[q, :len(best)] = candidate_scores[best]
+        return result_ids, result_scores
+
+    # === Persistence === #
+    def save(self, path):
+        ids, vectors = self.row_vectors()
+        arrays = {
+            "dim": np.array(self.dim),
+            "nprobe": np.array(self.nprobe),
+            "brute_force_threshold": np.array(self.brute_force_threshold),
+            "version": np.array(-1 if self.version is None else self.version, dtype=np.int64),
+            "ids": ids,
+            "vectors": vectors,
+        }
+        if self.trained:
+            arrays["centroids"] = self.centroids
+            arrays["list_sizes"] = np.array([len(list_ids) for list_ids in self.list_ids], dtype=np.int64)
+        # Readers (the agent, the snapshot watcher) may load it at any time: never expose a partial file
+        path = Path(path)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            index = cls(int(data["dim"]), int(data["nprobe"]), int(data["brute_force_threshold"]))
+            version = int(data["version"])
+            index.version = None if version < 0 else version
+            ids, vectors = data["ids"], data["vectors"]
+            if "centroids" in data:
+                index.centroids = data["centroids"]
+                bounds = np.concatenate([[0], np.cumsum(data["list_sizes"])])
+                index.list_ids = [ids[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+                index.list_vectors = [vectors[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+            else:
+                index.ids, index.vectors = ids, vectors
+        return index
+
+
+def index_path(name="products"):
+    return store_path(name) / INDEX_FILE
+
+
+def build_store_index(name="products", n_lists=None, nprobe=DEFAULT_NPROBE):
+    store = load_store(name)
+    started = time.perf_counter()
+    index = IVFIndex.build(store.vectors, n_lists=n_lists, nprobe=nprobe)
+    index.version = store.version
+    index.save(index_path(name))
+    mode = f"{len(index.centroids)} lists" if index.trained else "brute force"
+    print(f"✅ Indexed {len(index)} {name} ({mode}) in {time.perf_counter() - started:.2f}s")
+    return index
+
+
+def refresh_store_index(name="products"):
+    # Append-only catalog growth: insert just the new rows if every existing row is unchanged
+    store = load_store(name)
+    path = index_path(name)
+    if path.exists():
+        index = IVFIndex.load(path)
+        ids, vectors = index.row_vectors()
+        existing = len(ids)
+        unchanged = (
+            existing <= len(store)
+            and np.array_equal(np.sort(ids), np.arange(existing))
+            and np.allclose(normalize_rows(store.vectors[ids]), vectors, atol=1e-5)
+        )
+        if unchanged:
+            index.add(store.vectors[existing:], np.arange(existing, len(store)))
+            index.version = store.version
+            index.save(path)
+            print(f"✅ Inserted {len(store) - existing} new {name} into the ANN index")
+            return index
+    return build_store_index(name)
+
+
+def load_store_index(name, store):
+    # An index built for an older store version would return stale rows, so ignore it
+    path = index_path(name)
+    if not path.exists():
+        return None
+    index = IVFIndex.load(path)
+    if store.version is None or index.version != store.version:
+        print(f"⚠️ ANN index for '{name}' is out of date, using exact search. Rebuild with: python ann_index.py")
+        return None
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the IVF-flat ANN index for an embedding store")
+    parser.add_argument("name", nargs="?", default="products")
+    parser.add_argument("--lists", type=int, default=None, help="number of inverted lists (default: sqrt(N))")
+    parser.add_argument("--nprobe", type=int, default=DEFAULT_NPROBE, help="lists scanned per query")
+    parser.add_argument("--update", action="store_true", help="insert new rows instead of rebuilding")
+    args = parser.parse_args()
+    if args.update:
+        refresh_store_index(args.name)
+    else:
+        build_store_index(args.name, n_lists=args.lists, nprobe=args.nprobe)
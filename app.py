@@ -1,10 +1,15 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
-import json
 import os
 from datetime import datetime
 from firebase_config import db  # Firestore client
-from db.database import init_db, save_chat_memory, fetch_user_chats  # SQLite functions
+from db.database import (  # SQLite functions
+    init_db, pool as sqlite_pool, save_chat_memory, fetch_user_chats,
+    record_purchase, replace_purchase_aggregate, fetch_purchase_aggregate, purchase_aggregate_materialized
+)
+from checkout_queue import CheckoutQueue, FirestoreSink, JsonlSink, QueueFullError  # Durable checkout log
+from serving import DEFAULT_PAGE_SIZE, DEFAULT_SIMILAR, MAX_PAGE_SIZE, SnapshotWatcher  # ID-indexed, hot-reloaded products + recommendations
+from metrics import CONTENT_TYPE, REGISTRY, Gauge, begin_request, cache_gauges, end_request, stage  # Prometheus /metrics
 
 app = Flask(__name__)
 CORS(app, resources={r"/api/*": {"origins": "http://localhost:3000"}})
@@ -12,31 +17,117 @@ CORS(app, resources={r"/api/*": {"origins": "http://localhost:3000"}})
 # ------------------- Initialize SQLite -------------------
 init_db()
 
-# ------------------- Load Data -------------------
+# ------------------- Checkout Queue -------------------
 
-PRODUCTS_PATH = os.path.join('data', 'products_with_embeddings.json')
-RECOMMENDATIONS_PATH = os.path.join('data', 'recommendations.json')
+# Checkouts are fsynced to a local queue and batch-committed to Firestore in the
+# background. CHECKOUT_SINK=local writes them to data/checkouts.jsonl instead.
+checkout_sink = JsonlSink() if os.environ.get("CHECKOUT_SINK") == "local" else FirestoreSink(db)
+checkout_queue = CheckoutQueue(checkout_sink).start()
 
-try:
-    with open(PRODUCTS_PATH, 'r') as f:
-        all_products = json.load(f)
-except Exception as e:
-    print(f"❌ Error loading products file: {e}")
-    all_products = []
+# ------------------- Load Data -------------------
 
-try:
-    with open(RECOMMENDATIONS_PATH, 'r') as f:
-        recommendations_data = json.load(f)
-except Exception as e:
-    print(f"❌ Error loading recommendations file: {e}")
-    recommendations_data = []
+# Products + recommendations are indexed into a snapshot that a background
+# watcher swaps out whenever a new batch run or embedding store lands.
+watcher = SnapshotWatcher().start()
+
+# ------------------- Metrics -------------------
+
+# Route templates (not raw paths) label the series, so user IDs don't multiply them
+@app.before_request
+def start_timer():
+    begin_request(request.url_rule.rule if request.url_rule else "unmatched")
+
+@app.after_request
+def record_request(response):
+    end_request(request.method, response.status_code)
+    return response
+
+@app.teardown_request
+def record_failed_request(exc):
+    # Only reached without a response when a handler raised; end_request ignores finished requests
+    if exc is not None:
+        end_request(request.method, 500)
+
+cache_gauges("serving_cache", lambda: watcher.current.caches())
+REGISTRY.register(Gauge("serving_snapshot_load_seconds", "Time the current snapshot took to load",
+                        lambda: watcher.current.load_seconds))
+REGISTRY.register(Gauge("serving_snapshot_reloads_total", "Snapshots swapped in since startup",
+                        lambda: watcher.reloads, kind="counter"))
+REGISTRY.register(Gauge("checkout_queue_depth", "Checkouts waiting to be flushed to Firestore",
+                        lambda: checkout_queue.pending))
+REGISTRY.register(Gauge("checkout_queue_flushed_total", "Checkouts delivered to Firestore",
+                        lambda: checkout_queue.flushed_total, kind="counter"))
+REGISTRY.register(Gauge("checkout_queue_rejected_total", "Checkouts rejected because the queue was full",
+                        lambda: checkout_queue.rejected_total, kind="counter"))
+REGISTRY.register(Gauge("checkout_queue_dead_letters", "Checkouts the sink kept rejecting, parked in the dead-letter table",
+                        lambda: checkout_queue.dead_letters))
+REGISTRY.register(Gauge("sqlite_pool_connections", "Pooled SQLite connections by state",
+                        lambda: {("open",): sqlite_pool.stats()["open"], ("idle",): sqlite_pool.stats()["idle"]},
+                        ("state",)))
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(), mimetype=CONTENT_TYPE)
 
 # ------------------- Routes -------------------
 
-# 🛍 Get all products
+# 🛍 Get products (paged, projected, cached per snapshot)
 @app.route('/api/products', methods=['GET'])
 def get_products():
-    return jsonify(all_products), 200
+    snapshot = watcher.current
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "offset and limit must be integers"}), 400
+    if offset < 0 or not 1 <= limit <= MAX_PAGE_SIZE:
+        return jsonify({"error": f"offset must be >= 0 and limit between 1 and {MAX_PAGE_SIZE}"}), 400
+
+    # Embeddings are only returned when asked for explicitly (fields=...,embedding)
+    fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+    unknown = set(fields) - snapshot.product_fields - {"embedding"}
+    if unknown:
+        return jsonify({"error": f"Unknown fields: {', '.join(sorted(unknown))}"}), 400
+
+    with stage("lookup"):
+        page = snapshot.products_page(offset, limit, fields or None)
+    return cached_response(page)
+
+# 🧩 Similar products (precomputed neighbor table, body cached per snapshot)
+@app.route('/api/products/<product_id>/similar', methods=['GET'])
+def get_similar_products(product_id):
+    try:
+        product_id = int(product_id)
+        limit = int(request.args.get('limit', DEFAULT_SIMILAR))
+    except ValueError:
+        return jsonify({"error": "product_id and limit must be integers"}), 400
+    if limit < 1:
+        return jsonify({"error": "limit must be at least 1"}), 400
+
+    with stage("lookup"):
+        body = watcher.current.similar_body(product_id, limit)
+    if body is None:
+        return jsonify({"error": f"Product {product_id} not found"}), 404
+    return cached_response(body)
+
+def cached_response(body):
+    # ETag / 304 and gzip for a serving.CachedBody; identity and gzip bodies have distinct ETags
+    use_gzip = 'gzip' in request.accept_encodings
+    etags = (body.gzip_etag, body.etag) if use_gzip else (body.etag, body.gzip_etag)
+    for etag in etags:
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers={"ETag": f'"{etag}"', "Vary": "Accept-Encoding"})
+
+    headers = {"ETag": f'"{etags[0]}"', "Vary": "Accept-Encoding"}
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        return Response(body.gzipped, status=200, mimetype='application/json', headers=headers)
+    return Response(body.raw, status=200, mimetype='application/json', headers=headers)
+
+# ❤️ Health check with the serving snapshot version
+@app.route('/api/health', methods=['GET'])
+def health():
+    return jsonify({**watcher.health(), "checkout_queue": checkout_queue.metrics()}), 200
 
 # 💳 Handle checkout and log to Firestore
 @app.route('/api/checkout', methods=['POST'])
@@ -57,48 +148,83 @@ def checkout():
             "timestamp": datetime.utcnow()
         }
 
-        db.collection("checkouts").add(log_data)
+        # First checkout with aggregates: fold in the user's Firestore history before this
+        # checkout is queued, so it is neither missing from nor counted twice in the aggregate
+        try:
+            with stage("sqlite"):
+                materialized = purchase_aggregate_materialized(user_id)
+            if not materialized:
+                materialize_purchase_aggregate(user_id)
+        except Exception as e:
+            # Left unmaterialized; the recommendation fallback reloads it from Firestore
+            print(f"⚠️ Could not load purchase history for user {user_id}: {e}")
+
+        # Durable local write; the flusher delivers it to Firestore
+        with stage("queue"):
+            checkout_queue.enqueue(log_data)
+        # Keep the user's purchase aggregate current for the recommendation fallback. It is
+        # derived data and the checkout is already queued, so a failure must not make the client retry
+        try:
+            with stage("sqlite"):
+                record_purchase(user_id, cart)
+        except Exception as e:
+            print(f"⚠️ Purchase aggregate update failed for user {user_id}: {e}")
 
         return jsonify({"message": "Checkout successful and logged"}), 200
 
+    except QueueFullError as e:
+        print(f"⚠️ Checkout rejected: {e}")
+        return jsonify({"error": "Checkout queue is full, please retry"}), 503, {"Retry-After": "1"}
+
     except Exception as e:
         print(f"❌ Checkout error: {e}")
         return jsonify({"error": str(e)}), 500
 
-# 🧠 Get personalized recommendations
-@app.route('/api/recommendations/<user_id>', methods=['GET'])
-def get_recommendations(user_id):
-    try:
-        user_id = int(user_id)  # ✅ Convert to int for comparison
+def load_firestore_purchase_aggregate(user_id):
+    checkouts_ref = db.collection('checkouts').where('userId', '==', user_id)
 
-        # ✅ Check local recommendations.json
-        user_recommendations = next(
-            (user for user in recommendations_data if user['user_id'] == user_id),
-            None
-        )
+    purchased_ids = set()
+    category_counts = {}
 
-        if user_recommendations:
-            return jsonify({
-                "message": "✅ Recommendations fetched from recommendations.json",
-                "recommendations": user_recommendations['recommendations']
-            }), 200
+    for doc in checkouts_ref.stream():
+        data = doc.to_dict()
+        for item in data.get('cart', []):
+            item_id = item.get('id')
+            category = item.get('category')
+            if item_id:
+                purchased_ids.add(item_id)
+            if category:
+                category_counts[category] = category_counts.get(category, 0) + 1
 
-        # 🔄 Fallback to Firestore-based logic
-        checkouts_ref = db.collection('checkouts').where('userId', '==', user_id)
-        docs = checkouts_ref.stream()
+    return category_counts, purchased_ids
 
-        purchased_ids = set()
-        category_counts = {}
+def materialize_purchase_aggregate(user_id):
+    with stage("firestore"):
+        aggregate = load_firestore_purchase_aggregate(user_id)
+    with stage("sqlite"):
+        replace_purchase_aggregate(user_id, *aggregate)
+    return aggregate
 
-        for doc in docs:
-            data = doc.to_dict()
-            for item in data.get('cart', []):
-                item_id = item.get('id')
-                category = item.get('category')
-                if item_id:
-                    purchased_ids.add(item_id)
-                if category:
-                    category_counts[category] = category_counts.get(category, 0) + 1
+# 🧠 Get personalized recommendations
+@app.route('/api/recommendations/<user_id>', methods=['GET'])
+def get_recommendations(user_id):
+    try:
+        user_id = int(user_id)  # ✅ Convert to int for comparison
+        snapshot = watcher.current  # one consistent snapshot for the whole request
+
+        # ✅ Check the precomputed batch recommendations (indexed by user ID, body serialized once)
+        with stage("lookup"):
+            body = snapshot.recommendations_body(user_id)
+        if body is not None:
+            return Response(body, status=200, mimetype='application/json')
+
+        # 🔄 Fallback to the user's purchase aggregate (maintained by /api/checkout)
+        with stage("sqlite"):
+            aggregate = fetch_purchase_aggregate(user_id)
+        if aggregate is None:
+            # Firestore history not folded in yet: read it once and store it
+            aggregate = materialize_purchase_aggregate(user_id)
+        category_counts, purchased_ids = aggregate
 
         if not category_counts:
             return jsonify({
@@ -108,15 +234,14 @@ def get_recommendations(user_id):
 
         # 🎯 Recommend products from most purchased categories
         top_categories = sorted(category_counts, key=category_counts.get, reverse=True)[:2]
-        recommendations = [
-            p for p in all_products
-            if p.get('category') in top_categories and p.get('id') not in purchased_ids
-        ][:10]
+        with stage("lookup"):
+            recommendations = snapshot.products_in_categories(top_categories, purchased_ids, limit=10)
 
-        return jsonify({
-            "message": "✅ Recommendations fetched from Firestore.",
-            "recommendations": recommendations
-        }), 200
+        with stage("serialize"):
+            return jsonify({
+                "message": "✅ Recommendations fetched from Firestore.",
+                "recommendations": recommendations
+            }), 200
 
     except Exception as e:
         print(f"❌ Recommendation error: {e}")
@@ -134,7 +259,8 @@ def save_chat():
         if not user_id or not message or not response:
             return jsonify({"error": "userId, message, and response are required"}), 400
 
-        save_chat_memory(user_id, message, response)
+        with stage("sqlite"):
+            save_chat_memory(user_id, message, response)
 
         return jsonify({"message": "Chat saved successfully"}), 200
 
@@ -147,12 +273,14 @@ def save_chat():
 def get_chat_history(user_id):
     try:
         user_id = int(user_id)
-        chats = fetch_user_chats(user_id)
+        with stage("sqlite"):
+            chats = fetch_user_chats(user_id)
         chat_list = [
             {"message": msg, "response": res, "timestamp": ts}
             for msg, res, ts in chats
         ]
-        return jsonify({"chat_history": chat_list}), 200
+        with stage("serialize"):
+            return jsonify({"chat_history": chat_list}), 200
 
     except Exception as e:
         print(f"❌ Fetch chat error: {e}")
@@ -0,0 +1,36 @@
+from collections import defaultdict
+
+from firebase_config import db  # Firestore client
+from db.database import init_db, replace_purchase_aggregate
+
+# Rebuild every user's purchase aggregate from the Firestore checkout history.
+# Run once when enabling the aggregates (or to repair them); /api/checkout keeps
+# them current afterwards.
+
+def backfill():
+    init_db()
+
+    category_counts = defaultdict(lambda: defaultdict(int))
+    purchased_ids = defaultdict(set)
+    docs = 0
+
+    for doc in db.collection('checkouts').stream():
+        data = doc.to_dict()
+        user_id = data.get('userId')
+        if user_id is None:
+            continue
+        docs += 1
+        for item in data.get('cart', []):
+            if item.get('id'):
+                purchased_ids[user_id].add(item['id'])
+            if item.get('category'):
+                category_counts[user_id][item['category']] += 1
+
+    users = set(category_counts) | set(purchased_ids)
+    for user_id in users:
+        replace_purchase_aggregate(user_id, dict(category_counts[user_id]), purchased_ids[user_id])
+
+    print(f"✅ Rebuilt purchase aggregates for {len(users)} users from {docs} checkouts")
+
+if __name__ == "__main__":
+    backfill()
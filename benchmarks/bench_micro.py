@@ -0,0 +1,96 @@
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from ann_index import load_store_index
+from benchmarks.harness import measure, skipped, write_results
+from candidate_filters import CandidateFilter, load_purchases
+from embedding_store import load_store
+from generate_batch_recommendations import BatchScorer
+from recommendations_io import RECOMMENDATIONS_PATH, RecommendationsWriter, iter_recommendations
+from scoring import ScoringEngine, top_k_indices
+from serving import load_snapshot
+
+# Run from inside a workspace made by benchmarks/synthetic.py: every path below is its data/
+
+
+def run(repeat=5, batch=1024, k=10, seed=0):
+    rng = np.random.default_rng(seed)
+    results = []
+    print("🔬 Loading")
+    results.append(measure("load_store.products.mmap", lambda: load_store("products"), repeat))
+    results.append(measure("load_store.products.memory", lambda: load_store("products", mmap=False), repeat))
+    results.append(measure("load_store.users.mmap", lambda: load_store("users"), repeat))
+    results.append(measure("load_purchases", load_purchases, repeat))
+
+    product_store, user_store = load_store("products"), load_store("users")
+    n_products, n_users = len(product_store), len(user_store)
+    results.append(measure("ScoringEngine.from_store", lambda: ScoringEngine.from_store(product_store), repeat))
+    engine = ScoringEngine.from_store(product_store)
+    batch = min(batch, n_users)
+    sample = np.sort(rng.choice(n_users, batch, replace=False))
+    vectors = np.asarray(user_store.vectors[sample])
+    params = {"users": batch, "products": n_products, "k": k}
+
+    print("🔬 Scoring")
+    results.append(measure("score", lambda: engine.score(vectors), repeat, items=batch, **params))
+    scores = engine.score(vectors)
+    results.append(measure("top_k_indices", lambda: top_k_indices(scores, k), repeat, items=batch, **params))
+    results.append(measure("top_k.exact", lambda: engine.top_k(vectors, k), repeat, items=batch, **params))
+    candidate_filter = CandidateFilter()
+    candidates = candidate_filter.rows(engine)
+    results.append(measure("CandidateFilter.mask", lambda: CandidateFilter().mask(engine), repeat, **params))
+    results.append(measure("top_k.in_stock", lambda: engine.top_k(vectors, k, candidates=candidates), repeat,
+                           items=batch, **params))
+    preferred = [user_store.records[row].get("preferred_categories", []) for row in sample]
+    results.append(measure("category_bias", lambda: engine.category_bias(preferred, 0.1), repeat, **params))
+
+    index = load_store_index("products", product_store)
+    if index is None:
+        results.append(skipped("search.ann", "no ANN index in this workspace", **params))
+    else:
+        ann_engine = ScoringEngine.from_store(product_store, index=index)
+        results.append(measure("search.ann", lambda: ann_engine.search(vectors, k), repeat, items=batch, **params))
+
+    # The batch generator's full per-user path: bias, purchase exclusion, filters, explanations
+    scorer = BatchScorer(top_n=k, candidate_filter=candidate_filter)
+    results.append(measure("BatchScorer.recommend", lambda: list(scorer.recommend(sample)), repeat,
+                           items=batch, **params))
+
+    print("🔬 Serialization")
+    entries = list(iter_recommendations())
+    params = {"users": len(entries)}
+    results.append(measure("iter_recommendations", lambda: sum(1 for _ in iter_recommendations()), repeat,
+                           items=len(entries), **params))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "recommendations.jsonl"
+
+        def write():
+            with RecommendationsWriter(path) as writer:
+                writer.write_all(entries)
+
+        results.append(measure("RecommendationsWriter.write_all", write, repeat, items=len(entries), **params))
+
+    print("🔬 Serving snapshot")
+    results.append(measure("load_snapshot", lambda: load_snapshot(RECOMMENDATIONS_PATH), repeat,
+                           users=n_users, products=n_products))
+    snapshot = load_snapshot(RECOMMENDATIONS_PATH)
+    user_ids = [user_store.records[row]["user_id"] for row in sample]
+    results.append(measure("recommendations_body.cold", lambda: [snapshot.recommendations_body(u) for u in user_ids],
+                           1, warmup=0, items=batch, users=batch))
+    results.append(measure("recommendations_body.cached", lambda: [snapshot.recommendations_body(u) for u in user_ids],
+                           repeat, items=batch, users=batch))
+    results.append(measure("products_page.cached", lambda: snapshot.products_page(0, 100), repeat, limit=100))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scoring, top-k, loading and serialization micro-benchmarks")
+    parser.add_argument("--output", required=True, help="JSON results file")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=1024, help="users per scoring call")
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+    write_results(args.output, "micro", run(args.repeat, args.batch, args.k))
@@ -0,0 +1,94 @@
+import argparse
+import importlib
+import os
+import tempfile
+from pathlib import Path
+
+from benchmarks.fake_services import FakeOllama
+from benchmarks.harness import measure, skipped, write_results
+from embedding_store import load_manifest
+
+# End-to-end entry points, run from inside a workspace made by benchmarks/synthetic.py
+MAX_FULL_USERS = 200000  # full re-ranks above this many users are skipped unless raised
+QUERIES = ["wireless headphones", "yoga mat", "organic green tea", "ergonomic chair", "camping tent",
+           "kitchen blender", "mystery novel", "running shoes", "desk lamp", "water bottle"]
+
+
+def bench_recommend(sample_users, repeat):
+    # recommend.py loads its data at import time, so that is timed once on its own
+    results = [measure("recommend.import", lambda: importlib.import_module("recommend"), 1, warmup=0)]
+    recommend = importlib.import_module("recommend")
+    user_ids = [user["user_id"] for user in recommend.users[:sample_users]]
+    results.append(measure("recommend.recommend_products", lambda: [recommend.recommend_products(u) for u in user_ids],
+                           repeat, items=len(user_ids), users=len(user_ids)))
+    return results
+
+
+def bench_semantic_search(dim, repeat, latency):
+    with FakeOllama(dim=dim, latency=latency) as ollama:
+        os.environ["OLLAMA_URL"] = ollama.url
+        search = importlib.import_module("semantic_search")
+        search.client.base_url = ollama.url
+        search.client.dim = dim
+        results = [measure("semantic_search.first_call", lambda: search.semantic_search(QUERIES[0]), 1, warmup=0)]
+
+        def cold():
+            search.query_cache.clear()
+            search.result_cache.clear()
+            for query in QUERIES:
+                search.semantic_search(query)
+
+        results.append(measure("semantic_search.uncached", cold, repeat, items=len(QUERIES),
+                               queries=len(QUERIES), ollama_latency=latency))
+        results.append(measure("semantic_search.cached", lambda: [search.semantic_search(q) for q in QUERIES],
+                               repeat, items=len(QUERIES), queries=len(QUERIES)))
+    return results
+
+
+def bench_full_runs(n_users, repeat, max_full_users):
+    if n_users > max_full_users:
+        reason = f"{n_users} users > --max-full-users {max_full_users}"
+        return [skipped(name, reason, users=n_users) for name in
+                ("agent.recommend_products.full", "agent.recommend_products.noop", "batch.generate.full")]
+
+    agent = importlib.import_module("agents.recommendation_engine_agent")
+    batch = importlib.import_module("generate_batch_recommendations")
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        output = Path(tmp) / "agent.jsonl"
+        results.append(measure("agent.recommend_products.full", lambda: agent.recommend_products(True, output),
+                               repeat, warmup=0, items=n_users, users=n_users))
+        # Nothing changed since the last run: only the planning and merge cost is left
+        results.append(measure("agent.recommend_products.noop", lambda: agent.recommend_products(False, output),
+                               repeat, warmup=0, items=n_users, users=n_users))
+        output = Path(tmp) / "batch.jsonl"
+        results.append(measure(
+            "batch.generate.full",
+            lambda: batch.generate(workers=1, full=True, output_path=output, run_dir=Path(tmp) / "run"),
+            repeat, warmup=0, items=n_users, users=n_users, workers=1,
+        ))
+    return results
+
+
+def run(repeat=5, sample_users=100, max_full_users=MAX_FULL_USERS, ollama_latency=0.0):
+    manifest = load_manifest("users")
+    dim = load_manifest("products")["dim"]
+    results = []
+    print("🔬 recommend.py")
+    results += bench_recommend(sample_users, repeat)
+    print("🔬 semantic_search.py (fake Ollama)")
+    results += bench_semantic_search(dim, repeat, ollama_latency)
+    print("🔬 Full recommendation runs")
+    results += bench_full_runs(manifest["count"], max(1, min(repeat, 3)), max_full_users)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end benchmarks of the recommendation and search entry points")
+    parser.add_argument("--output", required=True, help="JSON results file")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--sample-users", type=int, default=100, help="users per recommend.py timing")
+    parser.add_argument("--max-full-users", type=int, default=MAX_FULL_USERS)
+    parser.add_argument("--ollama-latency", type=float, default=0.0, help="seconds the fake Ollama waits per request")
+    args = parser.parse_args()
+    write_results(args.output, "pipeline", run(args.repeat, args.sample_users, args.max_full_users, args.ollama_latency))
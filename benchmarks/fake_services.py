@@ -0,0 +1,72 @@
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+
+# Put this directory first on PYTHONPATH to replace firebase_admin with an in-memory stub
+STUBS_DIR = Path(__file__).resolve().parent / "stubs"
+
+
+def fake_embedding(text, dim):
+    # Deterministic per text, so repeated queries hit the same vector
+    seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32).tolist()
+
+
+class FakeOllama:
+    """Local stand-in for the Ollama embedding API (/api/embed and /api/embeddings) with a fixed latency."""
+
+    def __init__(self, dim=768, latency=0.0, host="127.0.0.1", port=0):
+        self.dim = dim
+        self.latency = latency
+        self.requests = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                fake.requests += 1
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if self.path == "/api/embed":
+                    texts = payload.get("input", [])
+                    texts = [texts] if isinstance(texts, str) else texts
+                    body = {"embeddings": [fake_embedding(text, fake.dim) for text in texts]}
+                elif self.path == "/api/embeddings":
+                    body = {"embedding": fake_embedding(payload.get("prompt", ""), fake.dim)}
+                else:
+                    self.send_error(404)
+                    return
+                raw = json.dumps(body).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
@@ -0,0 +1,72 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from contextlib import redirect_stdout
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+
+def timings(samples):
+    # Summary of per-call durations in seconds
+    samples = np.asarray(samples, dtype=np.float64)
+    return {
+        "runs": int(len(samples)),
+        "min": float(samples.min()),
+        "median": float(np.median(samples)),
+        "mean": float(samples.mean()),
+        "p95": float(np.percentile(samples, 95)),
+        "max": float(samples.max()),
+    }
+
+
+def measure(name, fn, repeat=5, warmup=1, items=None, quiet=True, **params):
+    """Time ``fn()`` ``repeat`` times after ``warmup`` untimed calls; ``items`` per call gives a throughput."""
+    samples = []
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull if quiet else sys.stdout):
+        for _ in range(warmup):
+            fn()
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - started)
+    result = {"name": name, "params": params, "seconds": timings(samples)}
+    if items:
+        result["items"] = items
+        result["items_per_second"] = items / result["seconds"]["median"]
+    print(f"  ⏱️ {name:<40} median {result['seconds']['median'] * 1000:10.2f} ms"
+          + (f"  ({result['items_per_second']:,.0f}/s)" if items else ""))
+    return result
+
+
+def skipped(name, reason, **params):
+    print(f"  ⏭️ {name:<40} skipped: {reason}")
+    return {"name": name, "params": params, "skipped": reason}
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=Path(__file__).resolve().parent).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.utcnow().isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def write_results(path, suite, results, **meta):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"suite": suite, "environment": environment(), **meta, "results": results}, f, indent=2)
+    print(f"📝 Results written to {path}")
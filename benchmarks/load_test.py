@@ -0,0 +1,139 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import requests
+
+from benchmarks.fake_services import STUBS_DIR
+from benchmarks.harness import timings, write_results
+
+STARTUP_TIMEOUT = 300  # seconds; loading a 1M-product snapshot takes a while
+
+
+def start_app(workspace, port, log_path=None):
+    """Launch the workspace's app.py against the in-memory Firestore stub and wait until it is healthy."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(STUBS_DIR), str(workspace)]))
+    log = open(log_path, "w") if log_path else subprocess.DEVNULL
+    process = subprocess.Popen([sys.executable, "-m", "benchmarks.serve_app", "--port", str(port)],
+                               cwd=workspace, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"App exited with code {process.returncode} during startup (see {log_path})")
+        try:
+            if requests.get(f"{url}/api/health", timeout=1).ok:
+                return process, url
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"App did not become healthy within {STARTUP_TIMEOUT}s")
+
+
+def scenarios(n_users, n_products):
+    # name -> fn(session, url, rng) issuing one request
+    def cart(rng):
+        return [{"id": rng.randint(1, n_products), "category": "Electronics", "price": 9.99}
+                for _ in range(rng.randint(1, 3))]
+
+    return {
+        "health": lambda s, url, rng: s.get(f"{url}/api/health"),
+        "products_page": lambda s, url, rng: s.get(
+            f"{url}/api/products", params={"offset": rng.randrange(0, max(n_products - 100, 1)), "limit": 100}),
+        "recommendations": lambda s, url, rng: s.get(f"{url}/api/recommendations/{rng.randint(1, n_users)}"),
+        "similar": lambda s, url, rng: s.get(f"{url}/api/products/{rng.randint(1, n_products)}/similar"),
+        "checkout": lambda s, url, rng: s.post(
+            f"{url}/api/checkout", json={"userId": rng.randint(1, n_users), "cart": cart(rng)}),
+        "chat_save": lambda s, url, rng: s.post(
+            f"{url}/api/chat", json={"userId": rng.randint(1, n_users), "message": "hi", "response": "hello"}),
+        "chat_history": lambda s, url, rng: s.get(f"{url}/api/chat/{rng.randint(1, n_users)}"),
+        "metrics": lambda s, url, rng: s.get(f"{url}/metrics"),
+    }
+
+
+def run_scenario(name, request_fn, url, concurrency, duration, seed=0):
+    """Closed loop: ``concurrency`` clients each send their next request as soon as the last one returns."""
+    latencies, statuses, errors = [], {}, []
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client(worker):
+        rng = random.Random(seed * 1000 + worker)
+        session = requests.Session()
+        local_latencies, local_statuses, local_errors = [], {}, 0
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            try:
+                response = request_fn(session, url, rng)
+                local_statuses[response.status_code] = local_statuses.get(response.status_code, 0) + 1
+            except requests.RequestException:
+                local_errors += 1
+                continue
+            local_latencies.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local_latencies)
+            for status, count in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+            errors.append(local_errors)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(worker,)) for worker in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "name": f"http.{name}",
+        "params": {"concurrency": concurrency, "duration": duration},
+        "requests": len(latencies),
+        "requests_per_second": len(latencies) / elapsed,
+        "status_counts": {str(status): count for status, count in sorted(statuses.items())},
+        "connection_errors": sum(errors),
+    }
+    if latencies:
+        result["seconds"] = {**timings(latencies), "p50": float(np.percentile(latencies, 50)),
+                             "p99": float(np.percentile(latencies, 99))}
+        print(f"  🌐 {name:<16} {result['requests_per_second']:8.1f} req/s  p50 {result['seconds']['p50'] * 1000:7.2f} ms"
+              f"  p99 {result['seconds']['p99'] * 1000:7.2f} ms  {result['status_counts']}")
+    return result
+
+
+def run(workspace, concurrency=8, duration=10.0, port=5050, names=None):
+    workspace = Path(workspace).resolve()
+    store = workspace / "data" / "embeddings"
+    n_users = json.loads((store / "users" / "manifest.json").read_text())["count"]
+    n_products = json.loads((store / "products" / "manifest.json").read_text())["count"]
+
+    process, url = start_app(workspace, port, log_path=workspace / "app.log")
+    try:
+        results = []
+        all_scenarios = scenarios(n_users, n_products)
+        for name in names or all_scenarios:
+            results.append(run_scenario(name, all_scenarios[name], url, concurrency, duration))
+        results.append({"name": "http.health_after", "health": requests.get(f"{url}/api/health").json()})
+        return results
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP load test of app.py in a benchmark workspace (Firestore stubbed)")
+    parser.add_argument("workspace", help="directory made by benchmarks/synthetic.py")
+    parser.add_argument("--output", required=True, help="JSON results file")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument("--port", type=int, default=5050)
+    parser.add_argument("--scenario", action="append", help="run only this scenario (repeatable)")
+    args = parser.parse_args()
+    write_results(args.output, "http", run(args.workspace, args.concurrency, args.duration, args.port, args.scenario))
@@ -0,0 +1,100 @@
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from benchmarks import load_test
+from benchmarks.harness import environment
+from benchmarks.synthetic import parse_size, prepare
+
+BENCH_DIR = Path(__file__).resolve().parent
+WORKSPACES_DIR = BENCH_DIR / "workspaces"
+RESULTS_DIR = BENCH_DIR / "results"
+SUITES = ("micro", "pipeline", "http")
+REGRESSION_THRESHOLD = 1.2  # median this many times slower than the baseline counts as a regression
+
+
+def run_in_workspace(workspace, module, output, *args):
+    # Micro and pipeline suites import the workspace's code, so they run as its own process
+    subprocess.run([sys.executable, "-m", module, "--output", str(output), *map(str, args)], cwd=workspace, check=True)
+    with open(output, "r") as f:
+        return json.load(f)["results"]
+
+
+def run_size(size, args):
+    workspace = WORKSPACES_DIR / f"{size}"
+    n_users = parse_size(args.users or size)
+    n_products = parse_size(size)
+    print(f"\n📦 Size {size}: {n_users} users, {n_products} products")
+    if not (args.reuse and (workspace / "data" / "embeddings" / "products" / "manifest.json").exists()):
+        prepare(workspace, n_users, n_products, dim=args.dim)
+
+    runs = []
+    if "micro" in args.suites:
+        runs.append(("micro", run_in_workspace(workspace, "benchmarks.bench_micro", workspace / "micro.json",
+                                               "--repeat", args.repeat, "--batch", args.batch)))
+    if "pipeline" in args.suites:
+        runs.append(("pipeline", run_in_workspace(workspace, "benchmarks.bench_pipeline", workspace / "pipeline.json",
+                                                  "--repeat", args.repeat, "--max-full-users", args.max_full_users)))
+    if "http" in args.suites:
+        runs.append(("http", load_test.run(workspace, args.concurrency, args.duration, args.port)))
+    return [{"size": size, "users": n_users, "products": n_products, "suite": suite, **result}
+            for suite, results in runs for result in results]
+
+
+def _median(result):
+    return result.get("seconds", {}).get("median")
+
+
+def compare(results, baseline_path, threshold=REGRESSION_THRESHOLD):
+    """Print median ratios against an earlier results file; returns the regressed benchmark names."""
+    with open(baseline_path, "r") as f:
+        baseline = {(r["size"], r["name"]): r for r in json.load(f)["results"]}
+    regressions = []
+    print(f"\n📈 Compared with {baseline_path} (regression: > {threshold:.2f}x median)")
+    for result in results:
+        before = baseline.get((result["size"], result["name"]))
+        if before is None or not _median(before) or not _median(result):
+            continue
+        ratio = _median(result) / _median(before)
+        flag = "❌" if ratio > threshold else "✅"
+        print(f"  {flag} {result['size']:>6} {result['name']:<40} {ratio:6.2f}x")
+        if ratio > threshold:
+            regressions.append(f"{result['size']}:{result['name']}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the benchmark suites over synthetic catalogs of several sizes")
+    parser.add_argument("--sizes", default="1k,10k", help="catalog sizes, e.g. 1k,10k,100k,1m")
+    parser.add_argument("--users", default=None, help="users per size (default: same as the catalog size)")
+    parser.add_argument("--dim", type=int, default=768, help="embedding size of the synthetic vectors")
+    parser.add_argument("--suites", default=",".join(SUITES), help=f"subset of {','.join(SUITES)}")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=1024, help="users per micro-benchmark scoring call")
+    parser.add_argument("--max-full-users", type=int, default=200000, help="skip full re-ranks above this many users")
+    parser.add_argument("--concurrency", type=int, default=8, help="HTTP clients")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per HTTP scenario")
+    parser.add_argument("--port", type=int, default=5050)
+    parser.add_argument("--reuse", action="store_true", help="reuse existing workspaces instead of regenerating")
+    parser.add_argument("--output", default=None, help="results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--baseline", default=None, help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+    args.suites = [suite.strip() for suite in args.suites.split(",")]
+
+    started = time.perf_counter()
+    results = []
+    for size in [s.strip() for s in args.sizes.split(",") if s.strip()]:
+        results += run_size(size, args)
+
+    output = Path(args.output or RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"environment": environment(), "config": vars(args), "results": results}, f, indent=2)
+    print(f"\n📝 {len(results)} results written to {output} in {time.perf_counter() - started:.0f}s")
+
+    if args.baseline and compare(results, args.baseline, args.threshold):
+        raise SystemExit(1)
@@ -0,0 +1,11 @@
+import argparse
+
+# Serves app.py without the debug reloader, for benchmarks/load_test.py
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the API for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5050)
+    args = parser.parse_args()
+
+    from app import app
+    app.run(host=args.host, port=args.port, threaded=True, debug=False, use_reloader=False)
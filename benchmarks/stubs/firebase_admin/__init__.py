@@ -0,0 +1,7 @@
+# In-memory stand-in for firebase_admin, used by the benchmark load test (see benchmarks/fake_services.py)
+_apps = {}
+
+
+def initialize_app(credential=None, options=None, name="[DEFAULT]"):
+    _apps[name] = credential
+    return name
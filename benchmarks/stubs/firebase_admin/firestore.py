@@ -0,0 +1,84 @@
+import threading
+
+
+class _Document:
+    def __init__(self, data):
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class _DocumentRef:
+    def __init__(self, collection, doc_id):
+        self.collection = collection
+        self.id = doc_id
+
+
+class _Query:
+    def __init__(self, collection, filters=()):
+        self.collection = collection
+        self.filters = filters
+
+    def where(self, field, op, value):
+        if op != "==":
+            raise NotImplementedError(f"Only == filters are stubbed, got {op}")
+        return _Query(self.collection, self.filters + ((field, value),))
+
+    def stream(self):
+        with self.collection.client.lock:
+            documents = list(self.collection.documents.values())
+        for data in documents:
+            if all(data.get(field) == value for field, value in self.filters):
+                yield _Document(data)
+
+
+class _Collection(_Query):
+    def __init__(self, client, name):
+        super().__init__(self)
+        self.client = client
+        self.name = name
+        self.documents = {}
+
+    def document(self, doc_id):
+        return _DocumentRef(self, doc_id)
+
+
+class _Batch:
+    def __init__(self, client):
+        self.client = client
+        self.writes = []
+
+    def set(self, ref, data):
+        self.writes.append((ref, dict(data)))
+
+    def commit(self):
+        with self.client.lock:
+            for ref, data in self.writes:
+                ref.collection.documents[ref.id] = data
+        self.writes = []
+
+
+class Client:
+    """Collections held in memory: where(==)/stream, document refs and batched set/commit."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.collections = {}
+
+    def collection(self, name):
+        with self.lock:
+            return self.collections.setdefault(name, _Collection(self, name))
+
+    def batch(self):
+        return _Batch(self)
+
+
+_client = None
+
+
+def client():
+    global _client
+    if _client is None:
+        _client = Client()
+    return _client
@@ -0,0 +1,176 @@
+import argparse
+import json
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+# Code is copied into the workspace (every module resolves data/ next to itself), data is generated
+WORKSPACE_IGNORE = shutil.ignore_patterns(
+    ".git", "__pycache__", "data", "exports", "*.db", "*.db-*", "requests.jsonl", "results", "workspaces"
+)
+
+CATEGORIES = [
+    "Electronics", "Apparel", "Furniture", "Fitness", "Grocery", "Outdoors", "Books", "Kitchen",
+    "Beauty", "Toys", "Home Decor", "Sports", "Automotive", "Garden", "Pet Supplies", "Music",
+]
+ADJECTIVES = ["Wireless", "Organic", "Ergonomic", "Compact", "Premium", "Classic", "Smart", "Eco"]
+NOUNS = ["Headphones", "Shirt", "Chair", "Mat", "Tea", "Tent", "Novel", "Blender", "Lamp", "Bottle"]
+
+BLOCK_SIZE = 100000  # vectors generated per block
+NEIGHBOR_LIMIT = 100000  # the item-item table is O(products^2); skipped above this catalog size
+
+
+def parse_size(value):
+    # "1k", "250K", "1m" or a plain integer
+    value = str(value).strip().lower()
+    scale = {"k": 1000, "m": 1000000}.get(value[-1:], 1)
+    return int(float(value.rstrip("km")) * scale)
+
+
+def make_workspace(path):
+    """Copy the code (not the data) into ``path`` so generated data never touches the real data/."""
+    path = Path(path).resolve()
+    if path == REPO_DIR or path in REPO_DIR.parents:
+        raise ValueError(f"Refusing to use {path} as a workspace: it would replace the repository")
+    if path.exists():
+        shutil.rmtree(path)
+    shutil.copytree(REPO_DIR, path, ignore=WORKSPACE_IGNORE)
+    (path / "data").mkdir()
+    return path
+
+
+def _cluster_vectors(rng, centers, assignments, noise):
+    vectors = centers[assignments] + rng.standard_normal((len(assignments), centers.shape[1]), dtype=np.float32) * noise
+    return vectors.astype(np.float32)
+
+
+def generate_data(root, n_users, n_products, dim=768, purchases_per_user=5, top_k=5,
+                  out_of_stock=0.05, seed=0):
+    """Write products/users/purchases JSON, both embedding stores and a recommendations.jsonl under root/data.
+
+    Embeddings are clustered by category so scores, filters and the ANN index behave like real data.
+    """
+    from embedding_store import save_store
+    from recommendations_io import RecommendationsWriter, slim_item
+
+    started = time.perf_counter()
+    data_dir = Path(root) / "data"
+    data_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((len(CATEGORIES), dim), dtype=np.float32)
+
+    product_categories = rng.integers(len(CATEGORIES), size=n_products)
+    prices = np.round(rng.lognormal(3.5, 0.8, size=n_products), 2)
+    stocked = rng.random(n_products) >= out_of_stock
+    products = [
+        {
+            "id": i + 1,
+            "name": f"{ADJECTIVES[i % len(ADJECTIVES)]} {NOUNS[(i // len(ADJECTIVES)) % len(NOUNS)]} {i + 1}",
+            "category": CATEGORIES[c],
+            "description": f"Synthetic {CATEGORIES[c].lower()} product number {i + 1}.",
+            "price": float(p),
+            "in_stock": bool(s),
+        }
+        for i, (c, p, s) in enumerate(zip(product_categories.tolist(), prices.tolist(), stocked.tolist()))
+    ]
+    product_vectors = np.empty((n_products, dim), dtype=np.float32)
+    for start in range(0, n_products, BLOCK_SIZE):
+        stop = min(start + BLOCK_SIZE, n_products)
+        product_vectors[start:stop] = _cluster_vectors(rng, centers, product_categories[start:stop], 0.8)
+
+    # Each user leans towards 1-3 categories; their vector is the mean of those clusters plus noise
+    preferred = [rng.choice(len(CATEGORIES), size=rng.integers(1, 4), replace=False) for _ in range(n_users)]
+    users = [
+        {
+            "user_id": i + 1,
+            "name": f"User {i + 1}",
+            "interests": "Likes " + ", ".join(CATEGORIES[c].lower() for c in cats) + ".",
+            "preferred_categories": [CATEGORIES[c] for c in cats],
+        }
+        for i, cats in enumerate(preferred)
+    ]
+    user_vectors = np.empty((n_users, dim), dtype=np.float32)
+    for start in range(0, n_users, BLOCK_SIZE):
+        stop = min(start + BLOCK_SIZE, n_users)
+        block_centers = np.stack([centers[cats].mean(axis=0) for cats in preferred[start:stop]])
+        user_vectors[start:stop] = block_centers + rng.standard_normal(block_centers.shape, dtype=np.float32)
+
+    # Purchases skew towards popular products (Zipf-like), as real order logs do
+    popularity = 1.0 / np.arange(1, n_products + 1) ** 0.8
+    popularity /= popularity.sum()
+    purchase_counts = rng.poisson(purchases_per_user, size=n_users)
+    purchased = rng.choice(n_products, size=int(purchase_counts.sum()), p=popularity) + 1
+    purchases, offset = [], 0
+    for user_id, count in enumerate(purchase_counts.tolist(), start=1):
+        purchases.append({"user_id": user_id, "purchased_product_ids": sorted(set(purchased[offset:offset + count].tolist()))})
+        offset += count
+
+    for name, payload in (("products.json", products), ("users.json", users), ("past_purchases.json", purchases)):
+        with open(data_dir / name, "w") as f:
+            json.dump(payload, f)
+
+    store_dir = data_dir / "embeddings"
+    save_store("products", products, product_vectors, model="synthetic", store_dir=store_dir)
+    save_store("users", users, user_vectors, model="synthetic", store_dir=store_dir)
+
+    # Random (not scored) recommendations: serving and serialization only care about the shape
+    with RecommendationsWriter(data_dir / "recommendations.jsonl") as writer:
+        picks = rng.integers(1, n_products + 1, size=(n_users, top_k))
+        scores = np.sort(rng.random((n_users, top_k)), axis=1)[:, ::-1]
+        for user, ids, user_scores in zip(users, picks.tolist(), scores.tolist()):
+            writer.write({
+                "user_id": user["user_id"],
+                "name": user["name"],
+                "recommendations": [slim_item(product_id, score) for product_id, score in zip(ids, user_scores)],
+            })
+
+    seconds = time.perf_counter() - started
+    print(f"✅ Generated {n_users} users, {n_products} products (dim {dim}) in {seconds:.1f}s under {data_dir}")
+    return {"users": n_users, "products": n_products, "dim": dim, "seconds": round(seconds, 3)}
+
+
+def build_indexes(root, neighbors=True, ann=True):
+    # Run the real index builders inside the workspace, against its data/
+    n_products = json.loads((Path(root) / "data" / "embeddings" / "products" / "manifest.json").read_text())["count"]
+    if ann:
+        subprocess.run([sys.executable, "ann_index.py"], cwd=root, check=True)
+    if neighbors and n_products <= NEIGHBOR_LIMIT:
+        subprocess.run([sys.executable, "item_neighbors.py"], cwd=root, check=True)
+
+
+def prepare(workspace, n_users, n_products, dim=768, seed=0, neighbors=True, ann=True):
+    """Fresh workspace with generated data and indexes; benchmarks then run with cwd=workspace."""
+    workspace = make_workspace(workspace)
+    # Generate with the workspace's own modules so the data matches the code being benchmarked
+    subprocess.run(
+        [sys.executable, "-m", "benchmarks.synthetic", "--generate-only", "--users", str(n_users),
+         "--products", str(n_products), "--dim", str(dim), "--seed", str(seed), str(workspace)],
+        cwd=workspace, check=True,
+    )
+    build_indexes(workspace, neighbors=neighbors, ann=ann)
+    return workspace
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create a benchmark workspace with a synthetic catalog")
+    parser.add_argument("workspace", help="directory to create (the code is copied in, data is generated)")
+    parser.add_argument("--users", default="10k", help="e.g. 1000, 10k, 1m")
+    parser.add_argument("--products", default="10k")
+    parser.add_argument("--dim", type=int, default=768, help="embedding size (smaller keeps 1M catalogs in memory)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-neighbors", action="store_true", help="skip the item-item neighbor table")
+    parser.add_argument("--no-ann", action="store_true", help="skip the IVF index")
+    parser.add_argument("--generate-only", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.generate_only:
+        generate_data(args.workspace, parse_size(args.users), parse_size(args.products), args.dim, seed=args.seed)
+    else:
+        prepare(args.workspace, parse_size(args.users), parse_size(args.products), args.dim, args.seed,
+                neighbors=not args.no_neighbors, ann=not args.no_ann)
@@ -0,0 +1,82 @@
+import json
+from pathlib import Path
+
+import numpy as np
+
+BASE_DIR = Path(__file__).resolve().parent
+PAST_PURCHASES_PATH = BASE_DIR / "data" / "past_purchases.json"
+
+
+class CandidateFilter:
+    """Merchandising rules (stock, category allow/deny, price range) compiled to catalog rows.
+
+    ``rows(engine)`` is passed as ``candidates`` to ScoringEngine.top_k/iter_top_k/search,
+    so rows a rule removes are never scored. Masks are cached per engine.
+    """
+
+    def __init__(self, categories=None, exclude_categories=None, min_price=None, max_price=None,
+                 in_stock_only=True):
+        self.categories = sorted(set(categories)) if categories else None
+        self.exclude_categories = sorted(set(exclude_categories)) if exclude_categories else None
+        self.min_price = min_price
+        self.max_price = max_price
+        self.in_stock_only = in_stock_only
+        self._cache = {}
+
+    @property
+    def key(self):
+        # Stable description of the rules, e.g. to tell whether stored output used the same ones
+        return json.dumps({
+            "categories": self.categories,
+            "exclude_categories": self.exclude_categories,
+            "min_price": self.min_price,
+            "max_price": self.max_price,
+            "in_stock_only": self.in_stock_only,
+        }, sort_keys=True)
+
+    def mask(self, engine):
+        cached = self._cache.get(id(engine))
+        if cached is not None and cached[0] is engine:
+            return cached[1]
+
+        mask = np.ones(len(engine), dtype=bool)
+        if self.in_stock_only:
+            mask &= engine.in_stock
+        if self.categories is not None:
+            allowed = np.zeros(len(engine), dtype=bool)
+            for category in self.categories:
+                allowed[engine.category_rows.get(category, [])] = True
+            mask &= allowed
+        for category in self.exclude_categories or []:
+            mask[engine.category_rows.get(category, [])] = False
+        # Products without a usable price never pass a price rule
+        if self.min_price is not None:
+            mask &= engine.prices >= self.min_price
+        if self.max_price is not None:
+            mask &= engine.prices <= self.max_price
+
+        self._cache[id(engine)] = (engine, mask)
+        return mask
+
+    def rows(self, engine):
+        """Sorted catalog rows that pass, or None when nothing is filtered out (score everything)."""
+        mask = self.mask(engine)
+        return None if mask.all() else np.flatnonzero(mask)
+
+
+def load_purchases(path=PAST_PURCHASES_PATH):
+    # user_id -> purchased product IDs, from data/past_purchases.json
+    try:
+        with open(path, "r") as f:
+            records = json.load(f)
+    except FileNotFoundError:
+        return {}
+    return {record["user_id"]: list(record.get("purchased_product_ids", [])) for record in records}
+
+
+def purchased_rows(engine, purchases):
+    # user_id -> catalog rows to exclude, resolved once per run instead of per scoring block
+    return {
+        user_id: np.asarray(engine.rows_for(product_ids), dtype=np.int64)
+        for user_id, product_ids in purchases.items()
+    }
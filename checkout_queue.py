@@ -0,0 +1,290 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+QUEUE_PATH = BASE_DIR / "db" / "checkout_queue.db"
+LOCAL_SINK_PATH = BASE_DIR / "data" / "checkouts.jsonl"
+
+BATCH_SIZE = 200          # Firestore allows up to 500 writes per batch
+FLUSH_INTERVAL = 0.5      # seconds to idle when the queue is empty
+MAX_PENDING = 100000      # enqueue is refused beyond this (backpressure)
+RETRY_BASE = 1.0          # seconds; doubles per failed attempt
+RETRY_MAX = 60.0
+SPLIT_AFTER = 2           # failed attempts before a batch is halved to isolate a rejected record
+MAX_ATTEMPTS = 10         # a record failing this often on its own is moved to the dead-letter table
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkout_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_checkout_queue_next ON checkout_queue (next_attempt_at, id);
+-- Records the sink kept rejecting; ids are kept so a requeued record gets the same document ID
+CREATE TABLE IF NOT EXISTS checkout_dead_letter (
+    id INTEGER PRIMARY KEY,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL,
+    failed_at REAL NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS queue_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot queue value of type {type(value).__name__}")
+
+
+# ------------------- Sinks -------------------
+
+class FirestoreSink:
+    """Batch-commits checkouts to Firestore; document IDs make retried batches idempotent."""
+
+    def __init__(self, db, collection="checkouts"):
+        self.db = db
+        self.collection = collection
+
+    def write_batch(self, entries):
+        batch = self.db.batch()
+        collection = self.db.collection(self.collection)
+        for doc_id, record in entries:
+            record = dict(record)
+            if isinstance(record.get("timestamp"), str):
+                record["timestamp"] = datetime.fromisoformat(record["timestamp"])
+            batch.set(collection.document(doc_id), record)
+        batch.commit()
+
+
+class JsonlSink:
+    """Local sink for development and tests: appends one JSON line per checkout."""
+
+    def __init__(self, path=LOCAL_SINK_PATH):
+        self.path = Path(path)
+
+    def write_batch(self, entries):
+        with open(self.path, "a") as f:
+            for doc_id, record in entries:
+                f.write(json.dumps({"doc_id": doc_id, **record}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+# ------------------- Queue -------------------
+
+class CheckoutQueue:
+    """Durable SQLite write-ahead queue for checkouts, drained in batches by a background flusher.
+
+    ``enqueue`` returns once the record is fsynced locally; delivery to the sink is
+    at-least-once, with exponential backoff between failed attempts. A batch that keeps
+    failing is split in halves until the rejected record is alone, and a record that
+    still fails after ``MAX_ATTEMPTS`` is parked in ``checkout_dead_letter`` so it
+    cannot hold up the checkouts behind it.
+    """
+
+    def __init__(self, sink, path=QUEUE_PATH, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 max_pending=MAX_PENDING):
+        self.sink = sink
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")  # fsync on every commit
+        self.conn.executescript(SCHEMA)
+        self.instance_id = self._instance_id()
+        self.pending = self.conn.execute("SELECT COUNT(*) FROM checkout_queue").fetchone()[0]
+        self.dead_letters = self.conn.execute("SELECT COUNT(*) FROM checkout_dead_letter").fetchone()[0]
+
+        self.enqueued_total = 0
+        self.flushed_total = 0
+        self.failed_batches = 0
+        self.rejected_total = 0
+        self.last_error = None
+        self.last_flush_at = None
+
+    def _instance_id(self):
+        # Stable per queue file, so "<instance>-<row id>" never repeats across queue files
+        row = self.conn.execute("SELECT value FROM queue_meta WHERE key = 'instance_id'").fetchone()
+        if row:
+            return row[0]
+        instance_id = uuid.uuid4().hex[:12]
+        self.conn.execute("INSERT INTO queue_meta (key, value) VALUES ('instance_id', ?)", (instance_id,))
+        self.conn.commit()
+        return instance_id
+
+    def enqueue(self, record):
+        payload = json.dumps(record, default=_encode)
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected_total += 1
+                raise QueueFullError(f"Checkout queue is full ({self.pending} pending)")
+            cursor = self.conn.execute(
+                "INSERT INTO checkout_queue (payload, created_at) VALUES (?, ?)", (payload, time.time())
+            )
+            self.conn.commit()
+            self.pending += 1
+            self.enqueued_total += 1
+        if self.pending >= self.batch_size:
+            self._wake.set()
+        return f"{self.instance_id}-{cursor.lastrowid}"
+
+    def flush_once(self):
+        """Send one batch of due records to the sink; returns how many were delivered."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, payload, attempts FROM checkout_queue WHERE next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (time.time(), self.batch_size),
+            ).fetchall()
+        if not rows:
+            return 0
+        attempts = max(attempts for _, _, attempts in rows)
+        if attempts >= SPLIT_AFTER:
+            # Halve the batch on every further failure until the record the sink rejects is sent alone
+            rows = rows[:max(1, self.batch_size >> (attempts - SPLIT_AFTER + 1))]
+
+        entries = [(f"{self.instance_id}-{row_id}", json.loads(payload)) for row_id, payload, _ in rows]
+        ids = [(row_id,) for row_id, _, _ in rows]
+        try:
+            self.sink.write_batch(entries)
+        except Exception as e:
+            attempts += 1
+            self.failed_batches += 1
+            self.last_error = str(e)
+            if len(rows) == 1 and attempts >= MAX_ATTEMPTS:
+                self._dead_letter(rows[0][0], attempts, str(e))
+                return 0
+            retry_at = time.time() + min(RETRY_MAX, RETRY_BASE * (2 ** (attempts - 1)))
+            with self._lock:
+                self.conn.executemany(
+                    "UPDATE checkout_queue SET attempts = attempts + 1, next_attempt_at = ? WHERE id = ?",
+                    [(retry_at, row_id) for (row_id,) in ids],
+                )
+                self.conn.commit()
+            print(f"⚠️ Checkout flush failed (attempt {attempts}), retrying in {retry_at - time.time():.1f}s: {e}")
+            return 0
+
+        with self._lock:
+            self.conn.executemany("DELETE FROM checkout_queue WHERE id = ?", ids)
+            self.conn.commit()
+            self.pending -= len(ids)
+        self.flushed_total += len(ids)
+        self.last_flush_at = time.time()
+        self.last_error = None
+        return len(ids)
+
+    def _dead_letter(self, row_id, attempts, error):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO checkout_dead_letter (id, payload, created_at, attempts, failed_at, error) "
+                "SELECT id, payload, created_at, ?, ?, ? FROM checkout_queue WHERE id = ?",
+                (attempts, time.time(), error, row_id),
+            )
+            self.conn.execute("DELETE FROM checkout_queue WHERE id = ?", (row_id,))
+            self.conn.commit()
+            self.pending -= 1
+            self.dead_letters += 1
+        print(f"☠️ Checkout {self.instance_id}-{row_id} moved to the dead-letter table after {attempts} attempts: {error}")
+
+    def requeue_dead_letters(self):
+        """Move every dead-lettered record back onto the queue (e.g. after fixing the sink); returns the count."""
+        with self._lock:
+            count = self.conn.execute(
+                "INSERT INTO checkout_queue (id, payload, created_at) "
+                "SELECT id, payload, created_at FROM checkout_dead_letter"
+            ).rowcount
+            self.conn.execute("DELETE FROM checkout_dead_letter")
+            self.conn.commit()
+            self.pending += count
+            self.dead_letters = 0
+        self._wake.set()
+        return count
+
+    def flush_all(self):
+        total = 0
+        while True:
+            flushed = self.flush_once()
+            if not flushed:
+                return total
+            total += flushed
+
+    # ------------------- Background Flusher -------------------
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="checkout-flusher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, flush=True):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if flush:
+            self.flush_all()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                flushed = self.flush_once()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"❌ Checkout flusher error: {e}")
+                flushed = 0
+            if flushed < self.batch_size:
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+
+    def metrics(self):
+        with self._lock:
+            oldest = self.conn.execute("SELECT MIN(created_at) FROM checkout_queue").fetchone()[0]
+        return {
+            "depth": self.pending,
+            "max_pending": self.max_pending,
+            "oldest_age_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+            "enqueued_total": self.enqueued_total,
+            "flushed_total": self.flushed_total,
+            "failed_batches": self.failed_batches,
+            "rejected_total": self.rejected_total,
+            "dead_letters": self.dead_letters,
+            "last_error": self.last_error,
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect or requeue the checkout queue's dead letters")
+    parser.add_argument("--requeue-dead-letters", action="store_true",
+                        help="move dead-lettered checkouts back onto the queue for the next app start")
+    args = parser.parse_args()
+    queue = CheckoutQueue(sink=None)
+    if args.requeue_dead_letters:
+        print(f"✅ Requeued {queue.requeue_dead_letters()} dead-lettered checkouts")
+    print(json.dumps(queue.metrics(), indent=2))
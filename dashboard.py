@@ -5,18 +5,19 @@ from wordcloud import WordCloud
 import seaborn as sns
 import pandas as pd
 
+from recommendations_io import iter_recommended_categories
+
 # Load data
-with open("data/recommendations.json", "r") as f:
-    recommendations = json.load(f)
+# Recommendations are streamed; only per-user category counts are kept
+user_category_counts = {user_id: Counter(categories) for user_id, categories in iter_recommended_categories()}
 
 with open("data/users.json", "r") as f:
     users = json.load(f)
 
 # ---------- 1. Top Recommended Categories ----------
 category_counter = Counter()
-for rec in recommendations:
-    for item in rec["recommendations"]:
-        category_counter[item["category"]] += 1
+for counts in user_category_counts.values():
+    category_counter.update(counts)
 
 top_categories = category_counter.most_common()
 
@@ -43,15 +44,12 @@ plt.show()
 # ---------- 3. Heatmap: User vs Category ----------
 # Create a matrix of user vs category count
 user_names = [u["name"] for u in users]
-all_categories = list({item["category"] for rec in recommendations for item in rec["recommendations"]})
+all_categories = list(category_counter)
 data_matrix = []
 
-for rec in recommendations:
-    row = []
-    rec_categories = [r["category"] for r in rec["recommendations"]]
-    for cat in all_categories:
-        row.append(rec_categories.count(cat))
-    data_matrix.append(row)
+for u in users:
+    counts = user_category_counts.get(u["user_id"], Counter())
+    data_matrix.append([counts.get(cat, 0) for cat in all_categories])
 
 df = pd.DataFrame(data_matrix, index=user_names, columns=all_categories)
 
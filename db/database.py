@@ -1,15 +1,135 @@
-import sqlite3
 import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DB_DIR = os.path.dirname(__file__)
+DB_PATH = os.path.join(DB_DIR, 'ecommerce.db')
+MIGRATIONS_DIR = os.path.join(DB_DIR, 'migrations')
+
+POOL_SIZE = int(os.environ.get('SQLITE_POOL_SIZE', 8))  # connections per worker process
+POOL_TIMEOUT = 10  # seconds to wait for a free connection before giving up
+BUSY_TIMEOUT = 5  # seconds a writer waits on another process's write lock
+STATEMENT_CACHE = 128  # prepared statements kept per connection
+
+# WAL lets readers run alongside the single writer; NORMAL only fsyncs at
+# checkpoints, which is fine for chat memory and the purchase aggregates
+# (the checkout queue keeps FULL for its own file).
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA cache_size=-16000',  # 16 MB page cache
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA mmap_size=268435456',
+)
+
+
+class ConnectionPool:
+    """Thread-safe pool of reusable SQLite connections, one pool per worker process.
+
+    Connections are opened lazily up to ``size`` and handed out most recently
+    used first, so each keeps its page cache and prepared statements warm.
+    """
+
+    def __init__(self, path, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # Connections must not cross a fork, so a new worker process starts an empty pool
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._opened = 0
 
-DB_PATH = os.path.join(os.path.dirname(__file__), 'ecommerce.db')
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _acquire(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            if self._opened < self.size:
+                self._opened += 1
+                opening = True
+            else:
+                opening = False
+        if opening:
+            try:
+                return self._open()
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No SQLite connection free within {self.timeout}s ({self.size} in use)")
+
+    def _release(self, conn):
+        if self._pid != os.getpid():
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection; uncommitted changes are rolled back before it goes back to the pool."""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._release(conn)
+
+    def stats(self):
+        return {'size': self.size, 'open': self._opened, 'idle': self._idle.qsize()}
+
+    def close(self):
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+            self._reset()
+
+
+pool = ConnectionPool(DB_PATH)
 
 def get_connection():
-    return sqlite3.connect(DB_PATH)
+    return pool.connection()
+
+def migrate(conn):
+    """Apply db/migrations/NNN_*.sql files newer than the database's user_version, in order."""
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    for name in sorted(os.listdir(MIGRATIONS_DIR)):
+        if not name.endswith('.sql'):
+            continue
+        number = int(name.split('_', 1)[0])
+        if number <= version:
+            continue
+        with open(os.path.join(MIGRATIONS_DIR, name), 'r') as f:
+            conn.executescript(f.read())
+        conn.execute(f'PRAGMA user_version = {number}')
+        print(f"🗃️ Applied migration {name}")
 
 def init_db():
     with get_connection() as conn:
-        with open(os.path.join(os.path.dirname(__file__), 'init_db.sql'), 'r') as f:
+        with open(os.path.join(DB_DIR, 'init_db.sql'), 'r') as f:
             conn.executescript(f.read())
+        migrate(conn)
 
 def save_chat_memory(user_id, message, response):
     with get_connection() as conn:
@@ -22,7 +142,75 @@ def save_chat_memory(user_id, message, response):
 def fetch_user_chats(user_id):
     with get_connection() as conn:
         cursor = conn.execute(
-            "SELECT message, response, timestamp FROM chat_memory WHERE user_id = ? ORDER BY timestamp DESC",
+            "SELECT message, response, timestamp FROM chat_memory WHERE user_id = ? "
+            "ORDER BY timestamp DESC, id DESC",
             (user_id,)
         )
         return cursor.fetchall()
+
+def _purchase_rows(user_id, cart):
+    category_rows = {}
+    product_rows = set()
+    for item in cart:
+        category = item.get('category')
+        if category:
+            category_rows[category] = category_rows.get(category, 0) + 1
+        if item.get('id'):
+            product_rows.add(item['id'])
+    return (
+        [(user_id, category, count) for category, count in category_rows.items()],
+        [(user_id, product_id) for product_id in product_rows]
+    )
+
+def record_purchase(user_id, cart):
+    category_rows, product_rows = _purchase_rows(user_id, cart)
+    with get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO user_category_counts (user_id, category, count) VALUES (?, ?, ?) "
+            "ON CONFLICT (user_id, category) DO UPDATE SET count = count + excluded.count",
+            category_rows
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO user_purchased_products (user_id, product_id) VALUES (?, ?)",
+            product_rows
+        )
+        conn.commit()
+
+def replace_purchase_aggregate(user_id, category_counts, purchased_ids):
+    with get_connection() as conn:
+        conn.execute("DELETE FROM user_category_counts WHERE user_id = ?", (user_id,))
+        conn.execute("DELETE FROM user_purchased_products WHERE user_id = ?", (user_id,))
+        conn.executemany(
+            "INSERT INTO user_category_counts (user_id, category, count) VALUES (?, ?, ?)",
+            [(user_id, category, count) for category, count in category_counts.items()]
+        )
+        conn.executemany(
+            "INSERT INTO user_purchased_products (user_id, product_id) VALUES (?, ?)",
+            [(user_id, product_id) for product_id in purchased_ids]
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO user_purchase_state (user_id, materialized_at) VALUES (?, CURRENT_TIMESTAMP)",
+            (user_id,)
+        )
+        conn.commit()
+
+def purchase_aggregate_materialized(user_id):
+    with get_connection() as conn:
+        return conn.execute(
+            "SELECT 1 FROM user_purchase_state WHERE user_id = ?", (user_id,)
+        ).fetchone() is not None
+
+def fetch_purchase_aggregate(user_id):
+    """Return (category_counts, purchased_ids), or None until the user's Firestore history has been folded in."""
+    with get_connection() as conn:
+        if conn.execute("SELECT 1 FROM user_purchase_state WHERE user_id = ?", (user_id,)).fetchone() is None:
+            return None
+        category_counts = dict(conn.execute(
+            "SELECT category, count FROM user_category_counts WHERE user_id = ?",
+            (user_id,)
+        ).fetchall())
+        purchased_ids = {row[0] for row in conn.execute(
+            "SELECT product_id FROM user_purchased_products WHERE user_id = ?",
+            (user_id,)
+        )}
+    return category_counts, purchased_ids
@@ -14,3 +14,18 @@ CREATE TABLE IF NOT EXISTS feedback (
     feedback_text TEXT,
     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
 );
+
+-- Per-user purchase aggregates, maintained on checkout
+CREATE TABLE IF NOT EXISTS user_category_counts (
+    user_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, category)
+);
+
+-- product_id keeps whatever type the cart used (numeric or "P123"-style IDs)
+CREATE TABLE IF NOT EXISTS user_purchased_products (
+    user_id INTEGER NOT NULL,
+    product_id NOT NULL,
+    PRIMARY KEY (user_id, product_id)
+);
@@ -0,0 +1,3 @@
+-- Chat history is read per user, newest first; without this index every
+-- fetch scans and sorts the whole chat_memory table.
+CREATE INDEX IF NOT EXISTS idx_chat_memory_user_timestamp ON chat_memory (user_id, timestamp);
@@ -0,0 +1,7 @@
+-- Users whose purchase aggregate includes their full Firestore checkout history.
+-- Aggregates without a row here were built from new checkouts only and are
+-- reloaded from Firestore before they are trusted.
+CREATE TABLE IF NOT EXISTS user_purchase_state (
+    user_id INTEGER PRIMARY KEY,
+    materialized_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,135 @@
+import hashlib
+import sqlite3
+import time
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+
+BASE_DIR = Path(__file__).resolve().parent
+CACHE_PATH = BASE_DIR / "data" / "embedding_cache.db"
+MAX_ENTRIES = 1_000_000  # least recently used entries are evicted beyond this
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model TEXT NOT NULL,
+    text_hash TEXT NOT NULL,
+    dim INTEGER NOT NULL,
+    vector BLOB NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (model, text_hash)
+);
+CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used);
+"""
+
+
+def normalize_text(text):
+    # Unicode and whitespace differences should not force a re-embed
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def text_hash(text):
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Persistent embedding cache keyed by (model name, normalized text hash)."""
+
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model, texts):
+        """Return one vector (or None on a miss) per text."""
+        hashes = [text_hash(text) for text in texts]
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(unique), 500):
+            chunk = unique[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                [model, *chunk],
+            )
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+
+        if found:
+            now = time.time()
+            self.conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                [(now, model, key) for key in found],
+            )
+            self.conn.commit()
+
+        vectors = [found.get(key) for key in hashes]
+        hit_count = sum(vector is not None for vector in vectors)
+        self.hits += hit_count
+        self.misses += len(vectors) - hit_count
+        return vectors
+
+    def put_many(self, model, texts, vectors):
+        now = time.time()
+        rows = [
+            (model, text_hash(text), len(vector), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+            if vector is not None
+        ]
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (model, text_hash, dim, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+        self.conn.commit()
+        self.evict()
+
+    def evict(self):
+        excess = len(self) - self.max_entries
+        if excess <= 0:
+            return
+        self.conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+        self.conn.commit()
+        self.evictions += excess
+
+    def embed_many(self, client, texts, progress=True):
+        """Serve cached vectors and send only new or edited texts to the embedding client."""
+        texts = list(texts)
+        vectors = self.get_many(client.model, texts)
+        # Group misses by hash so repeated texts are embedded once
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(text_hash(texts[i]), []).append(i)
+        if missing:
+            to_embed = [texts[positions[0]] for positions in missing.values()]
+            fresh = client.embed_many(to_embed, progress=progress)
+            self.put_many(client.model, to_embed, fresh)
+            for positions, vector in zip(missing.values(), fresh):
+                for i in positions:
+                    vectors[i] = vector
+        return vectors
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self),
+        }
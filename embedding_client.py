@@ -0,0 +1,179 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+# === Constants === #
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434")
+MODEL_NAME = "nomic-embed-text"
+EMBEDDING_SIZE = 768
+
+BATCH_SIZE = 32       # texts per request on the multi-input endpoint
+CONCURRENCY = 4       # requests in flight at once
+TIMEOUT = 30          # seconds per request
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5    # seconds; doubles on every retry
+BACKOFF_MAX = 8.0
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class EmbeddingError(Exception):
+    pass
+
+
+class EmbeddingStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.texts = 0
+        self.failures = 0
+        self.seconds = 0.0
+
+    def record(self, requests=0, retries=0, texts=0, failures=0, seconds=0.0):
+        with self._lock:
+            self.requests += requests
+            self.retries += retries
+            self.texts += texts
+            self.failures += failures
+            self.seconds += seconds
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "texts": self.texts,
+            "failures": self.failures,
+            "seconds": round(self.seconds, 3),
+            "texts_per_second": round(self.texts / self.seconds, 2) if self.seconds else 0.0,
+        }
+
+
+class EmbeddingClient:
+    """Ollama embedding client with a pooled session, batching, bounded concurrency and backoff.
+
+    Uses the multi-input ``/api/embed`` endpoint and falls back to one ``/api/embeddings``
+    call per text on servers that do not have it.
+    """
+
+    def __init__(self, base_url=OLLAMA_URL, model=MODEL_NAME, dim=EMBEDDING_SIZE, batch_size=BATCH_SIZE,
+                 concurrency=CONCURRENCY, timeout=TIMEOUT, max_retries=MAX_RETRIES,
+                 backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.dim = dim
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stats = EmbeddingStats()
+        self.supports_batch = None  # discovered on first call
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self):
+        self.session.close()
+
+    # === HTTP === #
+    def _sleep_before_retry(self, attempt):
+        # Exponential backoff with full jitter
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        time.sleep(random.uniform(0, delay))
+
+    def _post(self, path, payload):
+        last_error = None
+        for attempt in range(self.max_retries):
+            if attempt:
+                self.stats.record(retries=1)
+                self._sleep_before_retry(attempt - 1)
+            try:
+                self.stats.record(requests=1)
+                response = self.session.post(f"{self.base_url}{path}", json=payload, timeout=self.timeout)
+                if response.status_code == 404:
+                    return None
+                if response.status_code in RETRYABLE_STATUS:
+                    last_error = EmbeddingError(f"HTTP {response.status_code} from {path}")
+                    continue
+                response.raise_for_status()
+                return response.json()
+            except (requests.ConnectionError, requests.Timeout, ValueError) as e:
+                last_error = e
+            except requests.HTTPError as e:
+                # Other 4xx responses will not succeed on retry
+                raise EmbeddingError(str(e)) from e
+        raise EmbeddingError(f"{path} failed after {self.max_retries} attempts: {last_error}")
+
+    def _valid(self, embedding):
+        if isinstance(embedding, list) and len(embedding) == self.dim:
+            return np.array(embedding, dtype=np.float32)
+        return None
+
+    def _embed_batch(self, texts):
+        if self.supports_batch is not False:
+            data = self._post("/api/embed", {"model": self.model, "input": texts})
+            if data is not None:
+                self.supports_batch = True
+                embeddings = data.get("embeddings", [])
+                if len(embeddings) == len(texts):
+                    return [self._valid(embedding) for embedding in embeddings]
+                raise EmbeddingError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+            self.supports_batch = False
+
+        vectors = []
+        for text in texts:
+            data = self._post("/api/embeddings", {"model": self.model, "prompt": text})
+            vectors.append(self._valid((data or {}).get("embedding", [])))
+        return vectors
+
+    # === Public API === #
+    def embed(self, text):
+        """Embed one text; returns a float32 vector or None if no valid embedding came back."""
+        try:
+            return self._embed_batch([text])[0]
+        except EmbeddingError as e:
+            self.stats.record(failures=1)
+            print(f"❌ Failed to get embedding: {e}")
+            return None
+
+    def embed_many(self, texts, progress=True):
+        """Embed many texts concurrently; result order matches ``texts`` and failures are None."""
+        texts = list(texts)
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results = [None] * len(batches)
+        started = time.perf_counter()
+
+        def run(batch_no):
+            batch = batches[batch_no]
+            batch_started = time.perf_counter()
+            try:
+                vectors = self._embed_batch(batch)
+            except EmbeddingError as e:
+                print(f"❌ Batch {batch_no + 1}/{len(batches)} failed: {e}")
+                vectors = [None] * len(batch)
+            failed = sum(vector is None for vector in vectors)
+            self.stats.record(texts=len(batch) - failed, failures=failed)
+            if progress:
+                elapsed = time.perf_counter() - batch_started
+                print(f"📦 Batch {batch_no + 1}/{len(batches)}: {len(batch)} texts in {elapsed:.2f}s "
+                      f"({len(batch) / elapsed if elapsed else 0:.1f} texts/s)")
+            results[batch_no] = vectors
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            list(pool.map(run, range(len(batches))))
+
+        elapsed = time.perf_counter() - started
+        self.stats.record(seconds=elapsed)
+        if progress and texts:
+            print(f"⏱️ Embedded {len(texts)} texts in {elapsed:.2f}s ({len(texts) / elapsed:.1f} texts/s)")
+        return [vector for batch in results for vector in batch]
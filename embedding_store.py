@@ -0,0 +1,251 @@
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# === Layout === #
+# data/embeddings/<name>/
+#   vectors.npy    float32 (rows x dim), L2-normalized, loaded with mmap
+#   ids.npy        row -> record ID
+#   meta.json      records without their embeddings, in row order
+#   manifest.json  written last; its version changes on every save
+#   column_<c>.npy optional float64 per-row state (NaN = unset), patched with the vectors
+#   pending.npz    redo record for an in-progress update_rows (normally absent)
+BASE_DIR = Path(__file__).resolve().parent
+DATA_DIR = BASE_DIR / "data"
+STORE_DIR = DATA_DIR / "embeddings"
+
+# Legacy JSON files the stores replace, used as a fallback until migrated
+LEGACY_FILES = {
+    "products": DATA_DIR / "products_with_embeddings.json",
+    "users": DATA_DIR / "users_with_embeddings.json",
+}
+ID_KEYS = {"products": "id", "users": "user_id"}
+LOAD_ATTEMPTS = 3
+LOAD_RETRY_DELAY = 0.2  # seconds, grows with each attempt
+
+
+class InconsistentStoreError(RuntimeError):
+    """The store's files or manifest changed while it was being loaded."""
+
+
+class EmbeddingStore:
+    def __init__(self, name, ids, vectors, records, manifest):
+        self.name = name
+        self.ids = ids
+        self.vectors = vectors
+        self.records = records
+        self.manifest = manifest
+        self.row_of = {record_id: row for row, record_id in enumerate(ids.tolist())}
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def version(self):
+        return self.manifest.get("version")
+
+    @property
+    def normalized(self):
+        return self.manifest.get("normalized", False)
+
+    def row(self, record_id):
+        return self.row_of.get(record_id)
+
+    def vector(self, record_id):
+        row = self.row_of.get(record_id)
+        return None if row is None else self.vectors[row]
+
+
+def store_path(name, store_dir=STORE_DIR):
+    return Path(store_dir) / name
+
+
+def _write_atomic(path, write):
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _write_manifest(path, manifest):
+    _write_atomic(path / "manifest.json", lambda f: f.write(json.dumps(manifest, indent=2).encode()))
+
+
+def save_store(name, records, vectors, id_key=None, model=None, store_dir=STORE_DIR, extra=None):
+    id_key = id_key or ID_KEYS.get(name, "id")
+    path = store_path(name, store_dir)
+    path.mkdir(parents=True, exist_ok=True)
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim != 2 or len(vectors) != len(records):
+        raise ValueError(f"Expected {len(records)} vectors, got array of shape {vectors.shape}")
+    vectors = _normalize(vectors)
+
+    ids = np.asarray([record[id_key] for record in records])
+    meta = [{k: v for k, v in record.items() if k != "embedding"} for record in records]
+
+    _write_atomic(path / "vectors.npy", lambda f: np.save(f, vectors))
+    _write_atomic(path / "ids.npy", lambda f: np.save(f, ids))
+    _write_atomic(path / "meta.json", lambda f: f.write(json.dumps(meta, indent=2).encode()))
+    # Per-row state belongs to the rows being replaced
+    for column_file in path.glob("column_*.npy"):
+        column_file.unlink()
+
+    version = time.time_ns()
+    manifest = {
+        "name": name,
+        "version": version,
+        # Unlike version, not bumped by update_rows: identifies this set and order of rows
+        "rows_version": version,
+        "count": len(records),
+        "dim": int(vectors.shape[1]) if len(vectors) else 0,
+        "id_key": id_key,
+        "model": model,
+        "normalized": True,
+        **(extra or {}),
+    }
+    _write_manifest(path, manifest)
+    return manifest
+
+
+def update_rows(name, rows, vectors, extra=None, columns=None, store_dir=STORE_DIR):
+    """Overwrite some rows of an existing store in place and merge ``extra`` into its manifest.
+
+    ``columns`` maps column names to per-row values for the same rows. Everything is first
+    fsynced to pending.npz, so a crash part-way through is finished by ``recover_pending``
+    and the rows, columns and manifest always land together.
+    """
+    path = store_path(name, store_dir)
+    manifest = load_manifest(name, store_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No embedding store found at {path}")
+
+    rows = np.asarray(rows, dtype=np.int64)
+    vectors = _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(rows), -1))
+    manifest = {**manifest, **(extra or {}), "version": time.time_ns()}
+
+    column_values = {
+        f"column_{column}": np.asarray(values, dtype=np.float64) for column, values in (columns or {}).items()
+    }
+    _write_atomic(path / "pending.npz", lambda f: np.savez(
+        f, rows=rows, vectors=vectors, manifest=np.array(json.dumps(manifest)), **column_values
+    ))
+    _apply_pending(path)
+    return manifest
+
+
+def _apply_pending(path):
+    with np.load(path / "pending.npz") as pending:
+        rows, vectors = pending["rows"], pending["vectors"]
+        manifest = json.loads(str(pending["manifest"]))
+        column_values = {key: pending[key] for key in pending.files if key.startswith("column_")}
+    if len(rows):
+        stored = np.load(path / "vectors.npy", mmap_mode="r+")
+        stored[rows] = vectors
+        stored.flush()
+        del stored
+    for key, values in column_values.items():
+        column_file = path / f"{key}.npy"
+        if not column_file.exists():
+            _write_atomic(column_file, lambda f: np.save(f, np.full(manifest["count"], np.nan)))
+        stored = np.load(column_file, mmap_mode="r+")
+        stored[rows] = values
+        stored.flush()
+        del stored
+    _write_manifest(path, manifest)
+    (path / "pending.npz").unlink()
+
+
+def recover_pending(name, store_dir=STORE_DIR):
+    # Finish an update_rows interrupted by a crash; safe to call at any time from the writer
+    path = store_path(name, store_dir)
+    if (path / "pending.npz").exists():
+        print(f"🩹 Finishing interrupted update of the '{name}' embedding store")
+        _apply_pending(path)
+        return True
+    return False
+
+
+def load_column(name, column, store_dir=STORE_DIR):
+    # Per-row float64 state saved through update_rows(columns=...); NaN where never set
+    manifest = load_manifest(name, store_dir)
+    column_file = store_path(name, store_dir) / f"column_{column}.npy"
+    if manifest is None or not column_file.exists():
+        return np.full(manifest["count"] if manifest else 0, np.nan)
+    return np.load(column_file)
+
+
+def load_manifest(name, store_dir=STORE_DIR):
+    manifest_file = store_path(name, store_dir) / "manifest.json"
+    if not manifest_file.exists():
+        return None
+    with open(manifest_file, "r") as f:
+        return json.load(f)
+
+
+def _load_legacy(name):
+    with open(LEGACY_FILES[name], "r") as f:
+        records = json.load(f)
+    vectors = np.asarray([record["embedding"] for record in records], dtype=np.float32)
+    ids = np.asarray([record[ID_KEYS[name]] for record in records])
+    meta = [{k: v for k, v in record.items() if k != "embedding"} for record in records]
+    manifest = {"name": name, "version": None, "count": len(records), "normalized": False}
+    return EmbeddingStore(name, ids, vectors, meta, manifest)
+
+
+def _read_store_files(name, path, manifest, mmap):
+    vectors = np.load(path / "vectors.npy", mmap_mode="r" if mmap else None)
+    ids = np.load(path / "ids.npy")
+    with open(path / "meta.json", "r") as f:
+        records = json.load(f)
+
+    # save_store replaces the files one at a time, so a concurrent save can pair new vectors with old meta
+    counts = (len(vectors), len(ids), len(records), manifest.get("count"))
+    if len(set(counts)) != 1:
+        raise InconsistentStoreError(
+            f"'{name}' store files disagree (vectors, ids, meta, manifest count = {counts}); a save is in progress")
+    current = load_manifest(name, path.parent)
+    if current is None or current.get("version") != manifest.get("version"):
+        raise InconsistentStoreError(f"'{name}' store changed while it was being read")
+    return EmbeddingStore(name, ids, vectors, records, manifest)
+
+
+def load_store(name, store_dir=STORE_DIR, mmap=True):
+    """Load a store, retrying briefly if a writer replaces it mid-read; raises InconsistentStoreError if it keeps changing."""
+    for attempt in range(LOAD_ATTEMPTS):
+        manifest = load_manifest(name, store_dir)
+        if manifest is None:
+            if name in LEGACY_FILES and LEGACY_FILES[name].exists():
+                print(f"⚠️ No '{name}' embedding store yet, reading legacy {LEGACY_FILES[name].name}")
+                return _load_legacy(name)
+            raise FileNotFoundError(f"No embedding store found at {store_path(name, store_dir)}")
+        try:
+            return _read_store_files(name, store_path(name, store_dir), manifest, mmap)
+        except (InconsistentStoreError, FileNotFoundError, ValueError):
+            # FileNotFoundError / ValueError: a file was swapped out or truncated under us
+            if attempt == LOAD_ATTEMPTS - 1:
+                raise
+            time.sleep(LOAD_RETRY_DELAY * (attempt + 1))
+
+
+def migrate_legacy(name):
+    store = _load_legacy(name)
+    manifest = save_store(name, store.records, store.vectors)
+    print(f"✅ Migrated {manifest['count']} {name} into {store_path(name)}")
+
+
+if __name__ == "__main__":
+    for store_name in sys.argv[1:] or LEGACY_FILES:
+        migrate_legacy(store_name)
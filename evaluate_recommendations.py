@@ -1,70 +1,266 @@
+import argparse
 import json
-from collections import defaultdict
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
 
-# ------------------------ Load Data ------------------------
-with open('data/past_purchases.json', 'r') as f:
-    past_purchases = json.load(f)
+import numpy as np
 
-with open('data/recommendations.json', 'r') as f:
-    recommendations = json.load(f)
+from agents.behavior_analysis_agent import iter_behaviors
+from candidate_filters import PAST_PURCHASES_PATH, load_purchases
+from recommendations_io import RECOMMENDATIONS_PATH, iter_recommendations, product_id_of
 
-# Create a lookup for past purchases
-user_purchases = defaultdict(set)
+DEFAULT_KS = (1, 3, 5, 10)
+DEFAULT_EVENTS = ("buy",)
 
-# ----------------------- Data Cleanup ----------------------
-# Check for any missing or empty 'purchased_product_ids'
-for purchase in past_purchases:
-    user_id = purchase.get('user_id')  # Safely access user_id
-    purchased_product_ids = purchase.get('purchased_product_ids', [])  # Default to empty list if missing
-    if not purchased_product_ids:
-        print(f"⚠️ User {user_id} has no purchases.")
-    else:
-        for product_id in purchased_product_ids:
-            user_purchases[user_id].add(product_id)
 
-# -------------------- Evaluation Metrics --------------------
-def precision_at_k(recommended, relevant, k=10):
-    recommended_k = recommended[:k]
-    relevant_set = set(relevant)
-    hits = sum(1 for item in recommended_k if item in relevant_set)
-    return hits / k
+# ------------------------ Ground Truth ------------------------
+
+class GroundTruth:
+    """Relevant items per user as sorted (user, product) keys, plus training-side item popularity.
+
+    Users and products are mapped to dense indices so every metric is an array operation.
+    """
+
+    def __init__(self, relevant, popularity=None):
+        # relevant: {user_id: iterable of product IDs}; popularity: {product_id: interaction count}
+        self.user_index = {user_id: i for i, user_id in enumerate(relevant)}
+        self.product_index = {}
+        users, products = [], []
+        for user_id, product_ids in relevant.items():
+            for product_id in set(product_ids):
+                users.append(self.user_index[user_id])
+                products.append(self.product(product_id))
+        for product_id in popularity or {}:
+            self.product(product_id)
+
+        self.relevant_counts = np.bincount(np.asarray(users, dtype=np.int64), minlength=len(self.user_index))
+        self.keys = np.sort(self._keys(np.asarray(users, dtype=np.int64), np.asarray(products, dtype=np.int64)))
+        self.popularity = np.zeros(len(self.product_index), dtype=np.float64)
+        for product_id, count in (popularity or {}).items():
+            self.popularity[self.product_index[product_id]] = count
+
+    def product(self, product_id):
+        # Dense index for a product ID, assigned on first sight
+        return self.product_index.setdefault(product_id, len(self.product_index))
+
+    @staticmethod
+    def _keys(users, products):
+        return users << 32 | products
+
+    def hits(self, user_rows, rec_products):
+        """Boolean (users x K) matrix: is each recommended product relevant for its user."""
+        keys = self._keys(np.repeat(user_rows, rec_products.shape[1]).reshape(rec_products.shape), rec_products)
+        found = np.isin(keys, self.keys, assume_unique=False)
+        return found & (rec_products >= 0)
+
+
+def purchases_truth(path=PAST_PURCHASES_PATH):
+    purchases = {user_id: ids for user_id, ids in load_purchases(path).items() if ids}
+    popularity = {}
+    for product_ids in purchases.values():
+        for product_id in product_ids:
+            popularity[product_id] = popularity.get(product_id, 0) + 1
+    return GroundTruth(purchases, popularity)
+
+
+def behavior_truth(split_at, event_types=DEFAULT_EVENTS, events=None):
+    """Time-based split of the behavior log: events from ``split_at`` on are the test set,
+    earlier ones give item popularity (what a model trained before the split could know)."""
+    relevant, popularity = {}, {}
+    for event in events if events is not None else iter_behaviors():
+        try:
+            timestamp = datetime.fromisoformat(event["timestamp"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        user_id, product_id = _as_id(event["user_id"]), _as_id(event["product_id"])
+        if timestamp < split_at:
+            popularity[product_id] = popularity.get(product_id, 0) + 1
+        elif event.get("event_type") in event_types:
+            relevant.setdefault(user_id, set()).add(product_id)
+    return GroundTruth(relevant, popularity)
+
+
+def _as_id(value):
+    # The behavior log stores IDs as strings; the stores use ints
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+# ------------------------ Recommendations ------------------------
+
+def load_recommendation_matrix(truth, path=RECOMMENDATIONS_PATH, max_k=max(DEFAULT_KS)):
+    """(user rows into truth, users x max_k product indices padded with -1) for users with ground truth."""
+    user_rows, matrix = [], []
+    for entry in iter_recommendations(path):
+        row = truth.user_index.get(entry["user_id"])
+        if row is None:
+            continue
+        products = [truth.product(product_id_of(item)) for item in entry.get("recommendations", [])[:max_k]]
+        user_rows.append(row)
+        matrix.append(products + [-1] * (max_k - len(products)))
+    return np.asarray(user_rows, dtype=np.int64), np.asarray(matrix, dtype=np.int64).reshape(-1, max_k)
+
 
-def hit_rate(recommended, relevant):
-    return int(any(item in relevant for item in recommended))
+# ------------------------ Metrics ------------------------
 
-# --------------------- Evaluation Loop ----------------------
-total_users = 0
-precision_sum = 0
-hit_count = 0
+def ranking_metrics(hits, n_relevant, n_recommended, ks):
+    """{k: mean Precision/Recall/MAP/NDCG/MRR/hit rate at k} over users (rows of ``hits``).
 
-for user in recommendations:
-    user_id = user.get('user_id')  # Safely access user_id
-    recommended_products = user.get('recommendations', [])
+    Running sums over the top-max(ks) ranking are computed once and read at each k.
+    """
+    max_k = max(ks)
+    hits = hits[:, :max_k].astype(np.float64)
+    ranks = np.arange(1, max_k + 1, dtype=np.float64)
+    discounts = 1.0 / np.log2(ranks + 1)
+    cumulative_hits = np.cumsum(hits, axis=1)
+    cumulative_ap = np.cumsum(cumulative_hits / ranks * hits, axis=1)
+    cumulative_dcg = np.cumsum(hits * discounts, axis=1)
+    ideal_dcg = np.cumsum(discounts)
+    first_hit = np.where(cumulative_hits[:, -1] > 0, hits.argmax(axis=1) + 1, np.inf)
 
-    # Get recommended product IDs
-    recommended_ids = [item.get('id') for item in recommended_products if 'id' in item]
+    results = {}
+    for k in ks:
+        n_hits = cumulative_hits[:, k - 1]
+        shown = np.minimum(n_recommended, k)  # precision over what was actually recommended
+        relevant_in_k = np.minimum(n_relevant, k)
+        precision = np.divide(n_hits, shown, out=np.zeros_like(n_hits), where=shown > 0)
+        reciprocal_rank = np.where(first_hit <= k, 1.0 / first_hit, 0.0)
+        results[k] = {
+            f"precision@{k}": float(precision.mean()),
+            f"recall@{k}": float((n_hits / n_relevant).mean()),
+            f"map@{k}": float((cumulative_ap[:, k - 1] / relevant_in_k).mean()),
+            f"ndcg@{k}": float((cumulative_dcg[:, k - 1] / ideal_dcg[relevant_in_k - 1]).mean()),
+            f"mrr@{k}": float(reciprocal_rank.mean()),
+            f"hit_rate@{k}": float((n_hits > 0).mean()),
+        }
+    return results
 
-    if user_id in user_purchases:
-        relevant_ids = user_purchases[user_id]
 
-        # Evaluate Precision@10 and Hit Rate
-        prec = precision_at_k(recommended_ids, relevant_ids, k=10)
-        hit = hit_rate(recommended_ids, relevant_ids)
+def catalog_metrics(rec_products, ks, popularity, catalog_size):
+    """{k: coverage and popularity bias of the top-k lists}, from one pass over the top-max(ks) lists."""
+    max_k = max(ks)
+    rec_products = rec_products[:, :max_k]
+    valid = rec_products >= 0
+    products = np.where(valid, rec_products, 0)
+    # Position at which each product is first recommended to anyone (max_k = never)
+    first_seen = np.full(len(popularity), max_k, dtype=np.int64)
+    np.minimum.at(first_seen, products[valid], np.nonzero(valid)[1])
+    shown_per_rank = np.cumsum(valid.sum(axis=0))
 
-        precision_sum += prec
-        hit_count += hit
-        total_users += 1
+    biased = popularity.sum() > 0
+    if biased:
+        # Share of recommendations that go to the 20% most popular catalog items, and their mean
+        # popularity relative to the catalog average (1.0 = no bias)
+        # (products missing from ``popularity`` count as zero)
+        ranked = np.sort(popularity)[::-1]
+        n_head = max(int(np.ceil(0.2 * catalog_size)), 1)
+        threshold = ranked[n_head - 1] if n_head <= len(ranked) else 0.0
+        head = (popularity >= threshold) & (popularity > 0)
+        head_per_rank = np.cumsum((head[products] & valid).sum(axis=0))
+        popularity_per_rank = np.cumsum(np.where(valid, popularity[products], 0.0).sum(axis=0))
+        mean_popularity = popularity.sum() / catalog_size
+
+    results = {}
+    for k in ks:
+        metrics = {f"coverage@{k}": int((first_seen < k).sum()) / catalog_size}
+        n_shown = shown_per_rank[k - 1]
+        if biased and n_shown:
+            metrics[f"head_share@{k}"] = float(head_per_rank[k - 1] / n_shown)
+            metrics[f"popularity_lift@{k}"] = float(popularity_per_rank[k - 1] / n_shown / mean_popularity)
+        results[k] = metrics
+    return results
+
+
+def evaluate(truth, path=RECOMMENDATIONS_PATH, ks=DEFAULT_KS, catalog_size=None):
+    ks = sorted(set(ks))
+    user_rows, rec_products = load_recommendation_matrix(truth, path, max(ks))
+    results = {"recommendations": str(path), "users_evaluated": int(len(user_rows)),
+               "users_with_ground_truth": len(truth.user_index)}
+    if not len(user_rows):
+        return results
+
+    hits = truth.hits(user_rows, rec_products)
+    n_relevant = truth.relevant_counts[user_rows]
+    n_recommended = (rec_products >= 0).sum(axis=1)
+    catalog_size = max(catalog_size or 0, len(truth.product_index))
+    # Products first seen in the recommendations were never interacted with
+    popularity = np.zeros(len(truth.product_index), dtype=np.float64)
+    popularity[:len(truth.popularity)] = truth.popularity
+    ranking = ranking_metrics(hits, n_relevant, n_recommended, ks)
+    catalog = catalog_metrics(rec_products, ks, popularity, catalog_size)
+    for k in ks:
+        results.update(ranking[k])
+        results.update(catalog[k])
+    return results
+
+
+# ------------------------ CLI ------------------------
+
+def _catalog_size():
+    try:
+        from embedding_store import load_manifest
+        manifest = load_manifest("products")
+        return manifest["count"] if manifest else None
+    except Exception:
+        return None
+
+
+def _evaluate_variant(args):
+    truth_spec, path, ks, catalog_size = args
+    truth = build_truth(*truth_spec)
+    return evaluate(truth, path, ks, catalog_size)
+
+
+def build_truth(source, split_at=None, event_types=DEFAULT_EVENTS):
+    if source == "behavior":
+        return behavior_truth(split_at, event_types)
+    return purchases_truth()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline ranking metrics for recommendation outputs")
+    parser.add_argument("recommendations", nargs="*", default=[str(RECOMMENDATIONS_PATH)],
+                        help="one or more recommendation files (model variants) to compare")
+    parser.add_argument("-k", "--ks", default=",".join(map(str, DEFAULT_KS)), help="comma-separated cutoffs")
+    parser.add_argument("--truth", choices=("purchases", "behavior"), default="purchases",
+                        help="past_purchases.json, or a time split of the behavior log")
+    parser.add_argument("--split-date", help="behavior truth: ISO date/time where the test period starts")
+    parser.add_argument("--test-days", type=float, default=7.0,
+                        help="behavior truth without --split-date: the last N days are the test period")
+    parser.add_argument("--events", default=",".join(DEFAULT_EVENTS), help="behavior event types that count as relevant")
+    parser.add_argument("--workers", type=int, default=None, help="processes for evaluating variants in parallel")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    ks = [int(k) for k in args.ks.split(",") if k.strip()]
+    split_at = None
+    if args.truth == "behavior":
+        split_at = (datetime.fromisoformat(args.split_date) if args.split_date
+                    else datetime.now() - timedelta(days=args.test_days))
+    truth_spec = (args.truth, split_at, tuple(e.strip() for e in args.events.split(",")))
+    catalog_size = _catalog_size()
+
+    jobs = [(truth_spec, path, ks, catalog_size) for path in args.recommendations]
+    workers = min(args.workers or os.cpu_count() or 1, len(jobs))
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(_evaluate_variant, jobs))
     else:
-        print(f"⚠️ No past purchases found for user {user_id}, skipping...")
-
-# ------------------------ Results --------------------------
-if total_users > 0:
-    avg_precision = precision_sum / total_users
-    overall_hit_rate = hit_count / total_users
-
-    print("📊 Evaluation Results:")
-    print(f"Total Users Evaluated: {total_users}")
-    print(f"Average Precision@10: {avg_precision:.4f}")
-    print(f"Hit Rate: {overall_hit_rate:.4f}")
-else:
-    print("⚠️ No users found for evaluation.")
+        results = [_evaluate_variant(job) for job in jobs]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        print(f"📊 Evaluation Results: {result['recommendations']}")
+        print(f"Users Evaluated: {result['users_evaluated']} of {result['users_with_ground_truth']} with ground truth")
+        for name, value in result.items():
+            if "@" in name:
+                print(f"  {name:<20} {value:.4f}")
+
+
+if __name__ == "__main__":
+    main()
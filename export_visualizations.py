@@ -5,9 +5,11 @@ from wordcloud import WordCloud
 from collections import Counter
 import os
 
+from recommendations_io import iter_recommended_categories
+
 # Load recommendations and users
-with open("data/recommendations.json", "r") as f:
-    recommendations = json.load(f)
+# Recommendations are streamed; only per-user category counts are kept
+user_category_counts = {user_id: Counter(categories) for user_id, categories in iter_recommended_categories()}
 
 with open("data/users.json", "r") as f:
     users = json.load(f)
@@ -17,9 +19,8 @@ os.makedirs("exports", exist_ok=True)
 
 # 1️⃣ Bar Chart: Most Recommended Categories
 category_count = Counter()
-for user_obj in recommendations:
-    for rec in user_obj["recommendations"]:
-        category_count[rec["category"]] += 1
+for counts in user_category_counts.values():
+    category_count.update(counts)
 
 plt.figure(figsize=(8, 5))
 plt.bar(category_count.keys(), category_count.values(), color="skyblue")
@@ -44,15 +45,12 @@ plt.close()
 
 # 3️⃣ Heatmap: User vs Categories
 user_names = [user["name"] for user in users]
-categories = list({rec["category"] for user_obj in recommendations for rec in user_obj["recommendations"]})
+categories = list(category_count)
 
 user_category_matrix = []
-for user_obj in recommendations:
-    user_name = next((u["name"] for u in users if u["user_id"] == user_obj["user_id"]), "Unknown")
-    recs = user_obj["recommendations"]
-    user_counts = Counter(rec["category"] for rec in recs)
-    row = [user_counts.get(cat, 0) for cat in categories]
-    user_category_matrix.append(row)
+for user in users:
+    user_counts = user_category_counts.get(user["user_id"], Counter())
+    user_category_matrix.append([user_counts.get(cat, 0) for cat in categories])
 
 plt.figure(figsize=(10, 6))
 sns.heatmap(user_category_matrix, annot=True, fmt="d", xticklabels=categories, yticklabels=user_names, cmap="Blues")
@@ -1,64 +1,301 @@
+import argparse
 import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from pathlib import Path
+
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
 
-# Load products with embeddings
-with open("data/products_with_embeddings.json", "r") as f:
-    products = json.load(f)
+from candidate_filters import CandidateFilter, load_purchases, purchased_rows
+from embedding_store import load_store
+from incremental import merge_recommendations, plan_rerank, save_state, users_to_recompute
+from recommendations_io import RECOMMENDATIONS_PATH, RecommendationsWriter, iter_recommendations, slim_item
+from scoring import ScoringEngine
+import profiling
 
-# Load users with embeddings
-with open("data/users_with_embeddings.json", "r") as f:
-    users = json.load(f)
+OUTPUT_PATH = RECOMMENDATIONS_PATH
+RUN_DIR = Path("data/batch_run")  # shard files + manifest of the current (or failed) run
 
 # Configuration
 TOP_N = 3
 CATEGORY_BOOST = 0.1
+SHARD_SIZE = 20000  # users per shard
+
+BLAS_THREAD_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+
+# ------------------- Scoring (runs in every worker) -------------------
+
+class BatchScorer:
+    """Both stores memory-mapped read-only, so workers share the OS page cache instead of copies."""
+
+    def __init__(self, top_n=TOP_N, category_boost=CATEGORY_BOOST, candidate_filter=None):
+        self.top_n = top_n
+        self.category_boost = category_boost
+        self.candidate_filter = candidate_filter or CandidateFilter()
+        self.product_store = load_store("products")
+        self.user_store = load_store("users")
+        self.products = self.product_store.records
+        self.users = self.user_store.records
+        self.engine = ScoringEngine.from_store(self.product_store)
+        # Rows every user may be recommended, and each user's already-purchased rows
+        self.candidates = self.candidate_filter.rows(self.engine)
+        self.purchased = purchased_rows(self.engine, load_purchases())
+        self.no_rows = np.empty(0, dtype=np.int64)
+
+    def category_bias(self, user_rows, rows=None):
+        return self.engine.category_bias(
+            [self.users[row].get("preferred_categories", []) for row in user_rows], self.category_boost, rows
+        )
+
+    def excluded_rows(self, user_rows):
+        return [self.purchased.get(self.users[row]["user_id"], self.no_rows) for row in user_rows]
+
+    def recommend(self, selected):
+        # selected: user rows to score, in output order; yields one output entry per user
+        iter_blocks = self.engine.iter_top_k(
+            self.user_store.vectors[selected], self.top_n,
+            bias_fn=lambda start, stop: self.category_bias(selected[start:stop]),
+            exclude_fn=lambda start, stop: self.excluded_rows(selected[start:stop]),
+            candidates=self.candidates,
+        )
+        for start, rows, scores in iter_blocks:
+            for offset, (user_rows, user_scores) in enumerate(zip(rows, scores)):
+                user = self.users[selected[start + offset]]
+                preferred_categories = user.get("preferred_categories", [])
+
+                top_recommendations = []
+                for row, boosted in zip(user_rows, user_scores):
+                    if not np.isfinite(boosted):
+                        continue
+                    product = self.products[row]
+
+                    # The category boost is already in the score; split it back out for the explanation
+                    in_preferred = product["category"] in preferred_categories
+                    similarity = boosted - self.category_boost if in_preferred else boosted
+                    explanation = f"Similarity score: {similarity:.4f}"
+                    if in_preferred:
+                        explanation += f" + Category boost ({self.category_boost})"
+
+                    top_recommendations.append(slim_item(product["id"], boosted, explanation))
+
+                yield {
+                    "user_id": user["user_id"],
+                    "name": user["name"],
+                    "recommendations": top_recommendations
+                }
+
+
+_scorer = None
+_scorer_error = None
+
+def row_versions(product_store, user_store):
+    # Identify the set and order of rows shard results refer to; unlike "version", not bumped by update_rows
+    return [product_store.manifest.get("rows_version"), user_store.manifest.get("rows_version")]
+
+def _init_worker(top_n, category_boost, candidate_filter, expected_row_versions):
+    global _scorer, _scorer_error
+    _scorer = BatchScorer(top_n, category_boost, candidate_filter)
+    loaded = row_versions(_scorer.product_store, _scorer.user_store)
+    if loaded != expected_row_versions:
+        # A store was rebuilt after the run was planned; its rows no longer match selected.npy
+        _scorer_error = f"stores were rebuilt since the run started (row versions {loaded} != {expected_row_versions})"
+
+def _write_json_atomic(path, payload):
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(payload, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def run_shard(shard, user_rows, run_dir):
+    if _scorer_error:
+        raise RuntimeError(_scorer_error)
+    started = time.perf_counter()
+    with RecommendationsWriter(Path(run_dir) / shard["file"]) as writer:
+        writer.write_all(_scorer.recommend(user_rows))
+    return shard["id"], writer.count, time.perf_counter() - started
+
+
+# ------------------- Run manifest -------------------
+
+def new_run(run_dir, selected, plan, product_store, user_store, shard_size, top_n, filter_key):
+    shutil.rmtree(run_dir, ignore_errors=True)
+    (run_dir / "shards").mkdir(parents=True)
+    np.save(run_dir / "selected.npy", selected)
+    shards = [
+        {"id": i, "start": start, "stop": min(start + shard_size, len(selected)),
+         "file": f"shards/shard_{i:05d}.jsonl", "status": "pending"}
+        for i, start in enumerate(range(0, len(selected), shard_size))
+    ]
+    manifest = {
+        "started_at": time.time(),
+        "row_versions": row_versions(product_store, user_store),
+        # Shards computed under other settings must not be merged with new ones
+        "top_n": top_n,
+        "filter_key": filter_key,
+        "full": plan.full,
+        "profiles_seen": plan.profiles_seen,
+        "shards": shards,
+    }
+    _write_json_atomic(run_dir / "manifest.json", manifest)
+    return manifest
+
+def resumable_run(run_dir, product_store, user_store, top_n, filter_key):
+    manifest_file = run_dir / "manifest.json"
+    if not manifest_file.exists():
+        return None
+    with open(manifest_file, "r") as f:
+        manifest = json.load(f)
+    if manifest.get("row_versions") != row_versions(product_store, user_store):
+        print("⚠️ Stores were rebuilt since the interrupted run; starting over")
+        return None
+    if (manifest.get("top_n"), manifest.get("filter_key")) != (top_n, filter_key):
+        print("⚠️ --top-n or merchandising rules differ from the interrupted run; starting over")
+        return None
+    for shard in manifest["shards"]:
+        if shard["status"] == "done" and not (run_dir / shard["file"]).exists():
+            shard["status"] = "pending"
+    return manifest
+
+
+# ------------------- Driver -------------------
+
+def generate(workers=None, shard_size=SHARD_SIZE, full=False, resume=False, top_n=TOP_N,
+             output_path=OUTPUT_PATH, run_dir=RUN_DIR, keep_shards=False, candidate_filter=None):
+    started = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    output_path, run_dir = Path(output_path), Path(run_dir)
+    with profiling.stage("load"):
+        scorer = BatchScorer(top_n, candidate_filter=candidate_filter)
+    product_store, user_store = scorer.product_store, scorer.user_store
+
+    # Only users whose profile changed or whose top N a catalog change can affect (--full for everyone)
+    # Output made under different merchandising rules cannot be patched incrementally
+    producer = f"batch {scorer.candidate_filter.key}"
+    with profiling.stage("plan"):
+        plan = plan_rerank(output_path, user_store, product_store, producer, top_n, full=full,
+                           candidates=scorer.candidates)
 
-all_recommendations = []
+    filter_key = scorer.candidate_filter.key
+    manifest = resumable_run(run_dir, product_store, user_store, top_n, filter_key) if resume else None
+    if manifest is not None:
+        selected = np.load(run_dir / "selected.npy")
+        plan.full = manifest["full"]
+        plan.profiles_seen = manifest["profiles_seen"]
+        done = sum(shard["status"] == "done" for shard in manifest["shards"])
+        print(f"⏯️ Resuming: {done} of {len(manifest['shards'])} shards already done")
+    else:
+        with profiling.stage("plan", items=len(user_store)):
+            selected = users_to_recompute(
+                plan, output_path, user_store, scorer.engine, bias_fn=scorer.category_bias,
+                exclude_fn=scorer.excluded_rows, candidates=scorer.candidates,
+            )
+        if plan.full:
+            print(f"🔁 Full run ({plan.reason})")
+        else:
+            print(f"♻️ Incremental run: {len(selected)} of {len(user_store)} users to recompute")
+        manifest = new_run(run_dir, selected, plan, product_store, user_store, shard_size, top_n, filter_key)
 
-for user in users:
-    user_vector = np.array(user["embedding"])
-    preferred_categories = user.get("preferred_categories", [])
-    past_purchases = set(user.get("past_purchases", []))
+    pending = [shard for shard in manifest["shards"] if shard["status"] != "done"]
+    workers = max(1, min(workers, len(pending)))
+    print(f"⚙️ {len(pending)} shards of up to {shard_size} users on {workers} worker(s)")
 
-    scored = []
+    failed = []
+    # With more than one worker the scoring runs in other processes: only its wall time is seen here
+    with profiling.stage("recommend", items=sum(shard["stop"] - shard["start"] for shard in pending)):
+        if workers == 1:
+            global _scorer
+            _scorer = scorer
+            for shard in pending:
+                try:
+                    _finish_shard(manifest, run_dir, shard, run_shard(shard, selected[shard["start"]:shard["stop"]], run_dir))
+                except Exception as e:
+                    failed.append(_fail_shard(manifest, run_dir, shard, e))
+        else:
+            # One BLAS thread per worker; the pool provides the parallelism
+            threads = str(max(1, (os.cpu_count() or 1) // workers))
+            for var in BLAS_THREAD_VARS:
+                os.environ[var] = threads
+            with ProcessPoolExecutor(workers, mp_context=get_context("spawn"), initializer=_init_worker,
+                                     initargs=(top_n, scorer.category_boost, scorer.candidate_filter,
+                                               manifest["row_versions"])) as pool:
+                futures = {pool.submit(run_shard, shard, selected[shard["start"]:shard["stop"]], str(run_dir)): shard for shard in pending}
+                for future in as_completed(futures):
+                    shard = futures[future]
+                    try:
+                        _finish_shard(manifest, run_dir, shard, future.result())
+                    except Exception as e:
+                        failed.append(_fail_shard(manifest, run_dir, shard, e))
 
-    for product in products:
-        if product["id"] in past_purchases:
-            continue
+    if failed:
+        print(f"❌ {len(failed)} shard(s) failed: {sorted(failed)}. Re-run with --resume to retry them.")
+        return False
 
-        product_vector = np.array(product["embedding"])
-        similarity = cosine_similarity([user_vector], [product_vector])[0][0]
+    with profiling.stage("write", items=len(user_store)):
+        merge(manifest, run_dir, plan, product_store, user_store, output_path)
+    if not keep_shards:
+        shutil.rmtree(run_dir, ignore_errors=True)
+    print(f"✅ Batch recommendations saved to {output_path} in {time.perf_counter() - started:.1f}s")
+    return True
 
-        # Boost for preferred categories
-        boosted = similarity
-        explanation = f"Similarity score: {similarity:.4f}"
+def _finish_shard(manifest, run_dir, shard, result):
+    shard_id, count, seconds = result
+    shard.update(status="done", count=count, seconds=round(seconds, 3))
+    _write_json_atomic(run_dir / "manifest.json", manifest)
+    print(f"  ✔ shard {shard_id}: {count} users in {seconds:.1f}s")
 
-        if product["category"] in preferred_categories:
-            boosted += CATEGORY_BOOST
-            explanation += f" + Category boost ({CATEGORY_BOOST})"
+def _fail_shard(manifest, run_dir, shard, error):
+    shard.update(status="failed", error=str(error))
+    _write_json_atomic(run_dir / "manifest.json", manifest)
+    print(f"❌ Shard {shard['id']} failed: {error}")
+    return shard["id"]
 
-        scored.append({
-            "product_id": product["id"],
-            "name": product["name"],
-            "category": product["category"],
-            "description": product["description"],
-            "price": product["price"],
-            "score": round(boosted, 4),
-            "explanation": explanation
-        })
+def _iter_shards(manifest, run_dir):
+    for shard in manifest["shards"]:
+        yield from iter_recommendations(run_dir / shard["file"])
 
-    # Sort & take top N
-    top_recommendations = sorted(scored, key=lambda x: x["score"], reverse=True)[:TOP_N]
+def merge(manifest, run_dir, plan, product_store, user_store, output_path):
+    # Full runs stream shard by shard; incremental ones hold just the recomputed users
+    recomputed = _iter_shards(manifest, run_dir)
+    with RecommendationsWriter(output_path) as writer:
+        if plan.full:
+            writer.write_all(recomputed)
+        else:
+            writer.write_all(merge_recommendations(output_path, list(recomputed), user_store))
+    save_state(output_path, plan, product_store, user_store)
 
-    all_recommendations.append({
-        "user_id": user["user_id"],
-        "name": user["name"],
-        "recommendations": top_recommendations
-    })
+    manifest["merged_at"] = time.time()
+    _write_json_atomic(run_dir / "manifest.json", manifest)
 
-# Save to JSON
-with open("data/recommendations.json", "w") as f:
-    json.dump(all_recommendations, f, indent=2)
 
-print("✅ Batch recommendations saved to data/recommendations.json")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate batch recommendations for all users")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="users per shard")
+    parser.add_argument("--top-n", type=int, default=TOP_N)
+    parser.add_argument("--full", action="store_true", help="recompute every user, not just changed ones")
+    parser.add_argument("--resume", action="store_true", help="finish an interrupted run, keeping its done shards")
+    parser.add_argument("--keep-shards", action="store_true", help=f"keep {RUN_DIR} after merging")
+    parser.add_argument("--category", action="append", help="only recommend from this category (repeatable)")
+    parser.add_argument("--exclude-category", action="append", help="never recommend this category (repeatable)")
+    parser.add_argument("--min-price", type=float, default=None)
+    parser.add_argument("--max-price", type=float, default=None)
+    parser.add_argument("--include-out-of-stock", action="store_true", help="also recommend unavailable products")
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    candidate_filter = CandidateFilter(
+        categories=args.category, exclude_categories=args.exclude_category, min_price=args.min_price,
+        max_price=args.max_price, in_stock_only=not args.include_out_of_stock,
+    )
+    profiling.start("generate_batch_recommendations", args.profile)
+    try:
+        ok = generate(workers=args.workers, shard_size=args.shard_size, full=args.full, resume=args.resume,
+                      top_n=args.top_n, keep_shards=args.keep_shards, candidate_filter=candidate_filter)
+    finally:
+        profiling.finish()
+    raise SystemExit(0 if ok else 1)
@@ -1,49 +1,51 @@
 import json
-import requests
-import numpy as np
 
-OLLAMA_EMBEDDING_URL = "http://localhost:11434/api/embeddings"
-MODEL_NAME = "nomic-embed-text"
-
-def get_embedding(text, max_retries=3):
-    for attempt in range(max_retries):
-        try:
-            response = requests.post(OLLAMA_EMBEDDING_URL, json={
-                "model": MODEL_NAME,
-                "prompt": text
-            })
-            data = response.json()
-            embedding = data.get("embedding", [])
-
-            if isinstance(embedding, list) and len(embedding) == 768:
-                return np.array(embedding, dtype=np.float32)
-            else:
-                print(f"⚠️ Attempt {attempt + 1}: Invalid embedding length ({len(embedding)}). Retrying...")
-
-        except Exception as e:
-            print(f"❌ Exception on attempt {attempt + 1}: {e}")
-
-    print("❌ Failed to get a valid 768-length embedding after retries.")
-    return None
+from ann_index import refresh_store_index
+from embedding_cache import EmbeddingCache
+from embedding_client import EmbeddingClient
+from embedding_store import save_store
+from item_neighbors import build_neighbors
+import profiling
 
 def main():
-    with open("data/products.json", "r") as f:
+    with profiling.stage("load") as loaded, open("data/products.json", "r") as f:
         products = json.load(f)
+        loaded.add(len(products))
+
+    print(f"🔄 Embedding {len(products)} product descriptions...")
+    client = EmbeddingClient()
+    cache = EmbeddingCache()
+    # Only new or edited descriptions reach the model
+    with profiling.stage("embed", items=len(products)):
+        embeddings = cache.embed_many(client, [product["description"] for product in products])
 
     embedded_products = []
+    vectors = []
 
-    for product in products:
-        print(f"🔄 Embedding: {product['name']}")
-        description = product["description"]
-        vector = get_embedding(description)
+    for product, vector in zip(products, embeddings):
         if vector is not None:
-            product["embedding"] = vector.tolist()
             embedded_products.append(product)
+            vectors.append(vector)
+        else:
+            print(f"❌ No embedding for: {product['name']}")
+
+    print(f"📊 Embedding stats: {client.stats.as_dict()}")
+    print(f"🗃️ Cache stats: {cache.stats()}")
+    cache.close()
+    with profiling.stage("write", items=len(vectors)):
+        save_store("products", embedded_products, vectors, model=client.model)
 
-    with open("data/products_with_embeddings.json", "w") as f:
-        json.dump(embedded_products, f, indent=2)
+    print("✅ Embeddings saved to data/embeddings/products")
 
-    print("✅ Embeddings saved to data/products_with_embeddings.json")
+    # Keep the ANN index in step with the store (new products are inserted incrementally)
+    with profiling.stage("index", items=len(vectors)):
+        refresh_store_index("products")
+        # ...and the "similar products" table served by /api/products/<id>/similar
+        build_neighbors("products")
 
 if __name__ == "__main__":
-    main()
+    profiling.start("generate_embeddings", profiling.argv_modes())
+    try:
+        main()
+    finally:
+        profiling.finish()
@@ -1,52 +1,44 @@
 import json
-import requests
-import numpy as np
 from pathlib import Path
 
-# Constants
-OLLAMA_EMBEDDING_URL = "http://localhost:11434/api/embeddings"
-MODEL_NAME = "nomic-embed-text"
-EMBEDDING_SIZE = 768
-
-def get_embedding(text, max_retries=3):
-    for attempt in range(max_retries):
-        try:
-            response = requests.post(OLLAMA_EMBEDDING_URL, json={
-                "model": MODEL_NAME,
-                "prompt": text
-            })
-            data = response.json()
-            embedding = data.get("embedding", [])
-
-            if isinstance(embedding, list) and len(embedding) == EMBEDDING_SIZE:
-                return np.array(embedding, dtype=np.float32)
-            else:
-                print(f"⚠️ Attempt {attempt + 1}: Invalid embedding length ({len(embedding)}). Retrying...")
-
-        except Exception as e:
-            print(f"❌ Exception on attempt {attempt + 1}: {e}")
-
-    print("❌ Failed to get a valid embedding after retries.")
-    return None
+from embedding_cache import EmbeddingCache
+from embedding_client import EmbeddingClient
+from embedding_store import save_store
+import profiling
 
 def main():
-    with open("data/users.json", "r") as f:
+    with profiling.stage("load") as loaded, open("data/users.json", "r") as f:
         users = json.load(f)
+        loaded.add(len(users))
+
+    print(f"🔄 Embedding interests for {len(users)} users...")
+    client = EmbeddingClient()
+    cache = EmbeddingCache()
+    # Only new or edited interests reach the model
+    with profiling.stage("embed", items=len(users)):
+        embeddings = cache.embed_many(client, [", ".join(user["interests"]) for user in users])
 
     embedded_users = []
+    vectors = []
 
-    for user in users:
-        print(f"🔄 Embedding interests for: {user['name']}")
-        interest_text = ", ".join(user["interests"])
-        vector = get_embedding(interest_text)
+    for user, vector in zip(users, embeddings):
         if vector is not None:
-            user["embedding"] = vector.tolist()
             embedded_users.append(user)
+            vectors.append(vector)
+        else:
+            print(f"❌ No embedding for: {user['name']}")
 
-    with open("data/users_with_embeddings.json", "w") as f:
-        json.dump(embedded_users, f, indent=2)
+    print(f"📊 Embedding stats: {client.stats.as_dict()}")
+    print(f"🗃️ Cache stats: {cache.stats()}")
+    cache.close()
+    with profiling.stage("write", items=len(vectors)):
+        save_store("users", embedded_users, vectors, model=client.model)
 
-    print("✅ User embeddings saved to data/users_with_embeddings.json")
+    print("✅ User embeddings saved to data/embeddings/users")
 
 if __name__ == "__main__":
-    main()
+    profiling.start("generate_embeddings_users", profiling.argv_modes())
+    try:
+        main()
+    finally:
+        profiling.finish()
@@ -0,0 +1,234 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from embedding_store import load_column
+from recommendations_io import iter_recommendations, product_id_of, resolve_path
+from scoring import normalize_rows
+
+# Users checked per block when testing new products against current top-k thresholds
+USER_BATCH_SIZE = 1024
+
+# Product vectors are compared between runs through a few fixed random projections
+SIGNATURE_DIMS = 16
+SIGNATURE_TOLERANCE = 1e-4
+
+
+def state_path(output_path):
+    # data/recommendations.jsonl -> data/recommendations.state.npz
+    output_path = Path(output_path)
+    return output_path.with_name(output_path.stem + ".state.npz")
+
+
+def product_signatures(vectors):
+    # Compact per-row fingerprint that tolerates float noise from re-normalizing an unchanged store
+    vectors = normalize_rows(vectors)
+    projection = np.random.default_rng(0).standard_normal((vectors.shape[1], SIGNATURE_DIMS)).astype(np.float32)
+    return vectors @ projection
+
+
+def product_categories(records):
+    # Category per row; a change moves the product between category-boost groups without touching its vector
+    return np.asarray([str(record.get("category") or "") for record in records], dtype=str)
+
+
+def load_state(output_path):
+    path = state_path(output_path)
+    if not path.exists():
+        return None
+    with np.load(path) as state:
+        return {
+            "product_ids": state["product_ids"].tolist(),
+            "product_signatures": state["product_signatures"],
+            # None for states saved before categories were recorded
+            "product_categories": state["product_categories"] if "product_categories" in state.files else None,
+            "candidate_mask": state["candidate_mask"] if "candidate_mask" in state.files else None,
+            **json.loads(str(state["meta"])),
+        }
+
+
+def save_state(output_path, plan, product_store, user_store):
+    """Record what an output was computed from; call after the output itself is written."""
+    path = state_path(output_path)
+    meta = {
+        "producer": plan.producer,
+        "k": plan.k,
+        "users_rows_version": user_store.manifest.get("rows_version"),
+        "profiles_seen": plan.profiles_seen,
+    }
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        np.savez(f, product_ids=np.asarray(product_store.ids), product_signatures=plan.signatures,
+                 product_categories=plan.categories, candidate_mask=plan.candidate_mask,
+                 meta=np.array(json.dumps(meta)))
+    os.replace(tmp_path, path)
+
+
+def recommended_ids(entry):
+    return [product_id_of(item) for item in entry.get("recommendations", [])]
+
+
+class RerankPlan:
+    """What an incremental run has to recompute.
+
+    ``full`` means every user; otherwise ``dirty_rows`` (user rows whose profile changed,
+    who have no output yet, or whose output references a removed/changed product) and
+    ``added_rows`` (new or changed catalog rows, which may enter anyone's top-k). A product
+    counts as changed when its vector or its category did, and a product the run's
+    merchandising rules newly allow (restocked, repriced) counts as added.
+    """
+
+    def __init__(self, producer, k, signatures, categories, candidate_mask, profiles_seen, full=False,
+                 reason=None, dirty_rows=(), added_rows=()):
+        self.producer = producer
+        self.k = k
+        self.signatures = signatures
+        self.categories = categories
+        self.candidate_mask = candidate_mask
+        self.profiles_seen = profiles_seen
+        self.full = full
+        self.reason = reason
+        self.dirty_rows = set(dirty_rows)
+        self.added_rows = np.asarray(sorted(added_rows), dtype=np.int64)
+
+
+def plan_rerank(output_path, user_store, product_store, producer, k, full=False, candidates=None):
+    """Compare the stores with what ``output_path`` was computed from (its entries are streamed).
+
+    ``candidates`` are the catalog rows the run may recommend (None for every row), as passed to
+    ``users_to_recompute``; they are saved with the state to spot products a rule now lets through.
+    """
+    updated_at = load_column(user_store.name, "profile_updated_at")
+    profiles_seen = float(np.nanmax(updated_at)) if np.any(~np.isnan(updated_at)) else None
+    signatures = product_signatures(product_store.vectors)
+    categories = product_categories(product_store.records)
+    candidate_mask = np.ones(len(product_store), dtype=bool)
+    if candidates is not None:
+        candidate_mask[:] = False
+        candidate_mask[candidates] = True
+
+    state = None if full else load_state(output_path)
+    reason = "requested" if full else None
+    if not reason:
+        if state is None or not resolve_path(output_path).exists():
+            reason = "no previous run"
+        elif (state["producer"], state["k"]) != (producer, k):
+            reason = "previous output was made with different settings"
+        elif state["users_rows_version"] != user_store.manifest.get("rows_version"):
+            reason = "user store was rebuilt"
+        elif state["product_categories"] is None or state["candidate_mask"] is None:
+            reason = "previous run did not record product categories and filters"
+    if reason:
+        return RerankPlan(producer, k, signatures, categories, candidate_mask, profiles_seen,
+                          full=True, reason=reason)
+
+    # Profiles updated since the last run (see agents/user_profile_agent.py)
+    seen = state["profiles_seen"]
+    changed = ~np.isnan(updated_at) if seen is None else updated_at > seen
+    dirty = set(np.flatnonzero(changed).tolist())
+
+    # Users with no output yet
+    user_ids = user_store.ids.tolist()
+    with_output = {entry["user_id"] for entry in iter_recommendations(output_path)}
+    dirty.update(row for row, user_id in enumerate(user_ids) if user_id not in with_output)
+
+    # Catalog changes: new, re-embedded, re-categorized or newly allowed (e.g. restocked) products
+    # may enter any top-k; removed, changed or newly filtered-out ones invalidate the outputs that contain them
+    previous = {product_id: row for row, product_id in enumerate(state["product_ids"])}
+    product_ids = product_store.ids.tolist()
+    kept = [(row, previous[product_id]) for row, product_id in enumerate(product_ids) if product_id in previous]
+    changed, allowed, disallowed = set(), set(), set()
+    if kept:
+        rows, previous_rows = map(np.asarray, zip(*kept))
+        drift = np.abs(signatures[rows] - state["product_signatures"][previous_rows]).max(axis=1)
+        recategorized = categories[rows] != state["product_categories"][previous_rows]
+        changed = set(rows[(drift > SIGNATURE_TOLERANCE) | recategorized].tolist())
+        was_allowed = state["candidate_mask"][previous_rows]
+        allowed = set(rows[candidate_mask[rows] & ~was_allowed].tolist())
+        disallowed = set(rows[~candidate_mask[rows] & was_allowed].tolist())
+    added = [row for row, product_id in enumerate(product_ids)
+             if product_id not in previous or row in changed or row in allowed]
+    stale = (set(previous) - set(product_ids)) | {product_ids[row] for row in changed | disallowed}
+    if stale:
+        row_of_user = user_store.row_of
+        for entry in iter_recommendations(output_path):
+            if entry["user_id"] in row_of_user and stale.intersection(recommended_ids(entry)):
+                dirty.add(row_of_user[entry["user_id"]])
+
+    return RerankPlan(producer, k, signatures, categories, candidate_mask, profiles_seen,
+                      dirty_rows=dirty, added_rows=added)
+
+
+def users_to_recompute(plan, output_path, user_store, engine, bias_fn=None, exclude_fn=None,
+                       batch_size=USER_BATCH_SIZE, candidates=None):
+    """Sorted user rows to recompute: the dirty ones, any whose stored top-k now holds a product
+    they may no longer get, and any whose top-k an added product beats.
+
+    ``bias_fn(user_rows, rows)`` returns the score bias for those catalog rows (1D or per user),
+    ``exclude_fn(user_rows)`` one iterable of excluded catalog rows per user; both as in scoring.py.
+    ``candidates`` are the rows the run may recommend at all (None for every row).
+    """
+    if plan.full:
+        return np.arange(len(user_store))
+    affected = set(plan.dirty_rows)
+    added_rows = plan.added_rows
+    allowed = None
+    if candidates is not None:
+        added_rows = added_rows[np.isin(added_rows, candidates)]
+        allowed = np.zeros(len(engine), dtype=bool)
+        allowed[candidates] = True
+    if not len(added_rows) and allowed is None and exclude_fn is None:
+        return np.asarray(sorted(affected), dtype=np.int64)
+
+    current = {
+        entry["user_id"]: engine.rows_for(recommended_ids(entry)[:plan.k])
+        for entry in iter_recommendations(output_path)
+    }
+    check_rows = np.asarray([row for row in range(len(user_store)) if row not in affected], dtype=np.int64)
+    user_ids = user_store.ids
+    for start in range(0, len(check_rows), batch_size):
+        user_rows = check_rows[start:start + batch_size]
+        # Current top-k rows per user, padded with -1 (a short list accepts any new product)
+        current_rows = np.full((len(user_rows), plan.k), -1, dtype=np.int64)
+        for i, user_id in enumerate(user_ids[user_rows].tolist()):
+            rows = current.get(user_id, [])[:plan.k]
+            current_rows[i, :len(rows)] = rows
+
+        # Stored items that are now filtered out (e.g. out of stock) or excluded (e.g. purchased since)
+        invalid = np.zeros(len(user_rows), dtype=bool)
+        if allowed is not None:
+            invalid |= ((current_rows >= 0) & ~allowed[np.maximum(current_rows, 0)]).any(axis=1)
+        excluded = list(exclude_fn(user_rows)) if exclude_fn else None
+        if excluded is not None:
+            invalid |= np.array([np.isin(rows, list(ex)).any() for rows, ex in zip(current_rows, excluded)])
+        affected.update(user_rows[invalid].tolist())
+
+        if len(added_rows):
+            vectors = user_store.vectors[user_rows]
+            kth = engine.score_pairs(vectors, current_rows)
+            added = engine.score(vectors, added_rows)
+            if bias_fn:
+                kth = kth + bias_fn(user_rows, current_rows)
+                added = added + bias_fn(user_rows, added_rows)
+            if excluded is not None:
+                position = {row: col for col, row in enumerate(added_rows.tolist())}
+                for i, ex in enumerate(excluded):
+                    cols = [position[row] for row in ex if row in position]
+                    added[i, cols] = -np.inf
+            beaten = (added > kth.min(axis=1, keepdims=True)).any(axis=1)
+            affected.update(user_rows[beaten].tolist())
+    return np.asarray(sorted(affected), dtype=np.int64)
+
+
+def merge_recommendations(output_path, recomputed, user_store):
+    """Stream the previous output with recomputed entries swapped in; users no longer in the store are dropped."""
+    recomputed = {entry["user_id"]: entry for entry in recomputed}
+    user_ids = set(user_store.ids.tolist())
+    if resolve_path(output_path).exists():
+        for entry in iter_recommendations(output_path):
+            user_id = entry["user_id"]
+            if user_id in user_ids:
+                yield recomputed.pop(user_id, entry)
+    yield from recomputed.values()
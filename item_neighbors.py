@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from embedding_store import load_store, store_path
+from scoring import top_k_indices
+
+# === Layout (next to the store's vectors) === #
+# data/embeddings/<name>/
+#   neighbors_rows.npy    int32 (rows x N), each row's nearest other rows, best first (-1 = none)
+#   neighbors_scores.npy  float16 (rows x N), their cosine similarities
+#   neighbors.json        written last: store version the table was built from, N
+DEFAULT_NEIGHBORS = 20
+BLOCK_SIZE = 1024  # rows scored per matrix multiply; bounds the (block x catalog) score matrix
+
+
+class NeighborTable:
+    """Precomputed top-N similar items per row; lookups are a slice of two memory-mapped arrays."""
+
+    def __init__(self, rows, scores, meta):
+        self.rows = rows
+        self.scores = scores
+        self.meta = meta
+
+    @property
+    def version(self):
+        return self.meta.get("version")
+
+    def similar(self, row, k=None):
+        # (rows, scores) for one catalog row, best first, without the -1 padding
+        neighbor_rows = self.rows[row, :k]
+        found = neighbor_rows >= 0
+        return neighbor_rows[found], self.scores[row, :k][found].astype(np.float32)
+
+
+def _paths(name):
+    path = store_path(name)
+    return path / "neighbors_rows.npy", path / "neighbors_scores.npy", path / "neighbors.json"
+
+
+def build_neighbors(name="products", n_neighbors=DEFAULT_NEIGHBORS, block_size=BLOCK_SIZE):
+    store = load_store(name)
+    started = time.perf_counter()
+    matrix = store.vectors
+    if not store.normalized:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix = matrix / norms
+    count = len(store)
+    k = min(n_neighbors, max(count - 1, 0))
+
+    rows_path, scores_path, meta_path = _paths(name)
+    tmp_rows = rows_path.with_name(rows_path.name + ".tmp")
+    tmp_scores = scores_path.with_name(scores_path.name + ".tmp")
+    out_rows = np.lib.format.open_memmap(tmp_rows, mode="w+", dtype=np.int32, shape=(count, n_neighbors))
+    out_scores = np.lib.format.open_memmap(tmp_scores, mode="w+", dtype=np.float16, shape=(count, n_neighbors))
+    out_rows[:] = -1
+    out_scores[:] = 0
+
+    for start in range(0, count, block_size):
+        stop = min(start + block_size, count)
+        scores = np.asarray(matrix[start:stop]) @ np.asarray(matrix).T
+        scores[np.arange(stop - start), np.arange(start, stop)] = -np.inf  # an item is not its own neighbor
+        top = top_k_indices(scores, k)
+        out_rows[start:stop, :k] = top
+        out_scores[start:stop, :k] = np.take_along_axis(scores, top, axis=1)
+
+    out_rows.flush()
+    out_scores.flush()
+    del out_rows, out_scores
+    os.replace(tmp_rows, rows_path)
+    os.replace(tmp_scores, scores_path)
+    meta = {"name": name, "version": store.version, "count": count, "neighbors": n_neighbors}
+    tmp_meta = meta_path.with_name(meta_path.name + ".tmp")
+    with open(tmp_meta, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_meta, meta_path)
+    print(f"✅ Built top-{n_neighbors} neighbors for {count} {name} in {time.perf_counter() - started:.2f}s")
+    return meta
+
+
+def load_neighbors(name, store):
+    # A table built for an older store version points at the wrong rows, so ignore it
+    rows_path, scores_path, meta_path = _paths(name)
+    if not meta_path.exists():
+        return None
+    with open(meta_path, "r") as f:
+        meta = json.load(f)
+    if store.version is None or meta.get("version") != store.version:
+        print(f"⚠️ Neighbor table for '{name}' is out of date. Rebuild with: python item_neighbors.py")
+        return None
+    return NeighborTable(np.load(rows_path, mmap_mode="r"), np.load(scores_path, mmap_mode="r"), meta)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the item-to-item top-N neighbor table for an embedding store")
+    parser.add_argument("name", nargs="?", default="products")
+    parser.add_argument("-n", "--neighbors", type=int, default=DEFAULT_NEIGHBORS, help="neighbors kept per item")
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE, help="rows per matrix multiply")
+    args = parser.parse_args()
+    build_neighbors(args.name, args.neighbors, args.block_size)
@@ -0,0 +1,190 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# === Prometheus text exposition (format 0.0.4), no client library needed === #
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; request latencies from sub-millisecond cache hits to multi-second Firestore reads
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines += [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in values]
+        return lines
+
+
+class Histogram:
+    """Fixed-bucket histogram; an observation is one bisect and a few additions under a lock."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, list(values)) for labels, values in self._series.items())
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values[:-1]):
+                cumulative += count
+                le = (("le", _number(bound)),)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(values[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Value(s) read at scrape time: ``fn()`` returns a number, or {label tuple: number} with labelnames."""
+
+    def __init__(self, name, documentation, fn, labelnames=(), kind="gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+        self.kind = kind  # "counter" for totals that only reset when their owner is replaced
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        values = self.fn()
+        if not self.labelnames:
+            values = {(): values}
+        for labels, value in sorted(values.items()):
+            if value is not None:
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines += metric.render()
+            except Exception as e:
+                # A broken collector must not take the whole scrape down
+                lines.append(f"# {metric.name} unavailable: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter(
+    "http_requests_total", "HTTP requests by route template, method and status", ("route", "method", "status")))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ("route", "method")))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "stage_duration_seconds", "Time spent in one stage of a request (exclusive of nested stages)", ("route", "stage")))
+
+
+# === Per-request stage timing === #
+# Each thread handles one request at a time, so the current route and open stages are thread-local
+_local = threading.local()
+BACKGROUND_ROUTE = "background"  # stages outside a request, e.g. the snapshot watcher's reloads
+
+
+def begin_request(route):
+    _local.route = route
+    _local.started = time.perf_counter()
+    _local.stack = []
+
+
+def end_request(method, status):
+    route = getattr(_local, "route", None)
+    if route is None:
+        return
+    REQUEST_SECONDS.observe(time.perf_counter() - _local.started, route, method)
+    REQUESTS.inc(route, method, str(status))
+    _local.route = None
+
+
+@contextmanager
+def stage(name):
+    """Time a block as ``name`` for the current route; time in nested stages is only counted there."""
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    frame = [0.0]  # seconds spent in nested stages
+    stack.append(frame)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stack.pop()
+        if stack:
+            stack[-1][0] += elapsed
+        route = getattr(_local, "route", None) or BACKGROUND_ROUTE
+        STAGE_SECONDS.observe(elapsed - frame[0], route, name)
+
+
+def cache_gauges(prefix, caches_fn):
+    """Hit/miss/size/ratio series for LRUCache-like objects; ``caches_fn()`` returns {name: cache}."""
+    def series(field):
+        return lambda: {(name,): cache.stats()[field] for name, cache in caches_fn().items()}
+
+    for field, kind, documentation in (
+        ("hits", "counter", "Cache hits"),
+        ("misses", "counter", "Cache misses"),
+        ("hit_ratio", "gauge", "Cache hits / lookups"),
+        ("size", "gauge", "Entries in the cache"),
+    ):
+        name = f"{prefix}_{field}_total" if kind == "counter" else f"{prefix}_{field}"
+        REGISTRY.register(Gauge(name, documentation, series(field), ("cache",), kind=kind))
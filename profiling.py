@@ -0,0 +1,236 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import resource  # POSIX only; elsewhere peak RSS is reported as unavailable
+except ImportError:
+    resource = None
+
+# === Opt-in profiling for batch jobs === #
+# Off unless a job is started with --profile[=MODES] or PROFILING=MODES in the environment.
+# MODES: "1" for per-stage wall/CPU time, peak memory and items/sec; add "cprofile" and/or
+# "tracemalloc" (comma-separated) to also dump a cProfile / tracemalloc snapshot per stage.
+BASE_DIR = Path(__file__).resolve().parent
+PROFILE_DIR = BASE_DIR / "data" / "profiles"
+ENV_VAR = "PROFILING"
+ENV_DIR_VAR = "PROFILING_DIR"
+TOP_ENTRIES = 25  # functions / allocation sites listed in each stage summary
+
+# ru_maxrss is in kilobytes on Linux and bytes on macOS
+_RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+def _max_rss():
+    # Peak resident set size of this process in bytes, or None where it cannot be read
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _RSS_UNIT
+
+
+class _Items:
+    def __init__(self, count=0):
+        self.count = count
+
+    def add(self, count=1):
+        self.count += count
+
+
+class _StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.items = 0
+        self.peak_traced = None
+        self.max_rss = None
+        self.profile = None
+        self.snapshot = None
+
+    def as_dict(self):
+        stats = {
+            "stage": self.name,
+            "calls": self.calls,
+            "wall_seconds": round(self.wall, 6),
+            "cpu_seconds": round(self.cpu, 6),
+            # < 1 means the stage mostly waited (I/O, the embedding server, worker processes)
+            "cpu_utilization": round(self.cpu / self.wall, 3) if self.wall else None,
+            "max_rss_bytes": self.max_rss,
+        }
+        if self.items:
+            stats["items"] = self.items
+            stats["items_per_second"] = round(self.items / self.wall, 2) if self.wall else None
+        if self.peak_traced is not None:
+            stats["peak_traced_bytes"] = self.peak_traced
+        return stats
+
+
+class RunProfiler:
+    """Collects per-stage timings for one job run and writes them to ``<output_dir>/report.json``."""
+
+    def __init__(self, job, modes=(), output_dir=None):
+        self.job = job
+        self.modes = set(modes)
+        self.started_at = datetime.now()
+        stamp = self.started_at.strftime("%Y%m%d-%H%M%S")
+        self.output_dir = Path(output_dir or os.environ.get(ENV_DIR_VAR) or PROFILE_DIR) / f"{job}-{stamp}"
+        self.stages = {}
+        self._open = []  # stack of (stats, traced peak of the enclosing stage so far)
+        self._started = time.perf_counter()
+        self._cpu_started = time.process_time()
+        if "tracemalloc" in self.modes and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name, items=None):
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = _StageStats(name)
+        counter = _Items(items or 0)
+
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            # Keep the enclosing stage's peak before resetting it for this one
+            if self._open:
+                self._open[-1][1] = max(self._open[-1][1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self._open.append([stats, 0])
+
+        # Only one cProfile profiler can run at a time; nested stages show up in the outer one
+        profile = None
+        if "cprofile" in self.modes and len(self._open) == 1:
+            stats.profile = stats.profile or cProfile.Profile()
+            profile = stats.profile
+            profile.enable()
+
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield counter
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            if profile is not None:
+                profile.disable()
+            _, inner_peak = self._open.pop()
+            stats.calls += 1
+            stats.wall += wall
+            stats.cpu += cpu
+            stats.items += counter.count
+            max_rss = _max_rss()
+            if max_rss is not None:
+                stats.max_rss = max(stats.max_rss or 0, max_rss)
+            if tracing:
+                peak = max(inner_peak, tracemalloc.get_traced_memory()[1])
+                stats.peak_traced = max(stats.peak_traced or 0, peak)
+                if self._open:
+                    self._open[-1][1] = max(self._open[-1][1], peak)
+                if "tracemalloc" in self.modes:
+                    stats.snapshot = tracemalloc.take_snapshot()
+
+    def report(self):
+        wall = time.perf_counter() - self._started
+        return {
+            "job": self.job,
+            "argv": sys.argv,
+            "started_at": self.started_at.isoformat(),
+            "modes": sorted(self.modes),
+            "wall_seconds": round(wall, 6),
+            "cpu_seconds": round(time.process_time() - self._cpu_started, 6),
+            "max_rss_bytes": _max_rss(),
+            "stages": [stats.as_dict() for stats in self.stages.values()],
+        }
+
+    def _dump_stage(self, stats):
+        summary = io.StringIO()
+        if stats.profile is not None:
+            stats.profile.dump_stats(self.output_dir / f"{stats.name}.prof")
+            summary.write(f"# cProfile: top {TOP_ENTRIES} by cumulative time\n")
+            pstats.Stats(stats.profile, stream=summary).sort_stats("cumulative").print_stats(TOP_ENTRIES)
+        if stats.snapshot is not None:
+            stats.snapshot.dump(str(self.output_dir / f"{stats.name}.tracemalloc"))
+            summary.write(f"# tracemalloc: top {TOP_ENTRIES} allocation sites at the end of the stage\n")
+            for stat in stats.snapshot.statistics("lineno")[:TOP_ENTRIES]:
+                summary.write(f"{stat}\n")
+        if summary.tell():
+            (self.output_dir / f"{stats.name}.txt").write_text(summary.getvalue())
+
+    def finish(self):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        report = self.report()
+        for stats in self.stages.values():
+            self._dump_stage(stats)
+        with open(self.output_dir / "report.json", "w") as f:
+            json.dump(report, f, indent=2)
+        if "tracemalloc" in self.modes:
+            tracemalloc.stop()
+
+        print(f"\n⏱️ Profile for {self.job} ({report['wall_seconds']:.2f}s wall, {report['cpu_seconds']:.2f}s CPU)")
+        for stage in report["stages"]:
+            rate = f"  {stage['items_per_second']:,.0f} items/s" if stage.get("items_per_second") else ""
+            rss = stage["max_rss_bytes"]
+            rss = f"{rss / 2 ** 20:8.1f} MB RSS" if rss is not None else "     n/a MB RSS"
+            print(f"  {stage['stage']:<12} {stage['wall_seconds']:9.3f}s wall {stage['cpu_seconds']:9.3f}s CPU"
+                  f"  {rss}{rate}")
+        print(f"📝 Profile written to {self.output_dir}")
+        return report
+
+
+# === Module-level hooks: a no-op unless a job called start() === #
+_active = None
+
+
+def parse_modes(value):
+    # "1"/"on"/"true" -> timings only; otherwise a comma-separated list of extra modes
+    if not value or value.strip().lower() in ("0", "off", "false", "no"):
+        return None
+    modes = {mode.strip().lower() for mode in value.split(",") if mode.strip()}
+    return modes - {"1", "on", "true", "yes"}
+
+
+def argv_modes(argv=None):
+    # --profile or --profile=cprofile,tracemalloc, for scripts without argparse
+    for arg in argv if argv is not None else sys.argv[1:]:
+        if arg == "--profile":
+            return "1"
+        if arg.startswith("--profile="):
+            return arg.split("=", 1)[1]
+    return None
+
+
+def add_argument(parser):
+    parser.add_argument("--profile", nargs="?", const="1", default=None, metavar="MODES",
+                        help=f"per-stage timings; MODES may add cprofile,tracemalloc (also ${ENV_VAR})")
+
+
+def start(job, modes=None, output_dir=None):
+    """Start profiling ``job`` if ``modes`` (from --profile) or $PROFILING asks for it; returns the profiler or None."""
+    global _active
+    modes = parse_modes(modes if modes is not None else os.environ.get(ENV_VAR))
+    if modes is None:
+        return None
+    _active = RunProfiler(job, modes, output_dir)
+    return _active
+
+
+def finish():
+    global _active
+    profiler, _active = _active, None
+    return profiler.finish() if profiler is not None else None
+
+
+@contextmanager
+def stage(name, items=None):
+    """Time a pipeline stage of the running job; ``items`` (or ``counter.add(n)``) gives items/sec."""
+    if _active is None:
+        yield _Items()
+        return
+    with _active.stage(name, items) as counter:
+        yield counter
@@ -1,13 +1,16 @@
 import json
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+
+from candidate_filters import CandidateFilter
+from embedding_store import load_store
+from scoring import ScoringEngine
 
 # Load data
-with open("data/products_with_embeddings.json", "r") as f:
-    products = json.load(f)
+product_store = load_store("products")
+products = product_store.records
 
-with open("data/users_with_embeddings.json", "r") as f:
-    users = json.load(f)
+user_store = load_store("users")
+users = user_store.records
 
 with open("data/past_purchases.json", "r") as f:
     past_purchases_data = json.load(f)
@@ -16,44 +19,46 @@ with open("data/past_purchases.json", "r") as f:
 product_dict = {product["id"]: product for product in products}
 user_dict = {user["user_id"]: user for user in users}
 user_purchases_map = {u["user_id"]: set(u["purchased_product_ids"]) for u in past_purchases_data}
+engine = ScoringEngine.from_store(product_store)
+candidate_filter = CandidateFilter()  # in-stock products only
 
 
-def recommend_products(user_id, top_n=3, category_boost=0.1):
+def recommend_products(user_id, top_n=3, category_boost=0.1, candidate_filter=candidate_filter):
     user = user_dict.get(user_id)
     if not user:
         print(f"User {user_id} not found.")
         return []
 
-    user_vector = np.array(user["embedding"])
     preferred_categories = user.get("preferred_categories", [])
     past_purchases = user_purchases_map.get(user_id, set())
 
-    scored_products = []
+    purchased_rows = engine.rows_for(past_purchases)
+    bias = engine.category_bias([preferred_categories], category_boost)
+    rows, scores = engine.top_k(
+        user_store.vector(user_id), top_n, bias=bias, exclude=[purchased_rows],
+        candidates=candidate_filter.rows(engine),
+    )
 
-    for product in products:
-        if product["id"] in past_purchases:
-            continue
+    # Closest past purchase for every candidate at once
+    past_similarity = engine.max_similarity(rows[0], purchased_rows)
 
-        product_vector = np.array(product["embedding"])
-        similarity = cosine_similarity([user_vector], [product_vector])[0][0]
+    scored_products = []
+    for row, score, closest_purchase in zip(rows[0], scores[0], past_similarity):
+        if not np.isfinite(score):
+            continue
+        product = products[row]
+        similarity = score - bias[0, row]
         explanation_parts = []
 
         if similarity > 0.45:
             explanation_parts.append("🧠 Matches your interests")
         if product["category"] in preferred_categories:
-            similarity += category_boost
             explanation_parts.append("📂 From your preferred categories")
-        past_similarities = [
-            cosine_similarity([product_vector], [np.array(product_dict[pid]["embedding"])])[0][0]
-            for pid in past_purchases if pid in product_dict
-        ]
-        if past_similarities and max(past_similarities) > 0.45:
+        if closest_purchase > 0.45:
             explanation_parts.append("🛍️ Similar to things you've bought")
 
         explanation = " & ".join(explanation_parts) or "Matched your profile"
-        scored_products.append((product, similarity, explanation))
-
-    scored_products.sort(key=lambda x: x[1], reverse=True)
+        scored_products.append((product, float(score), explanation))
 
     print(f"\n✨ Top {top_n} Recommendations for {user['name']} (User ID: {user_id}):\n")
     for i, (product, score, explanation) in enumerate(scored_products[:top_n], start=1):
@@ -1,32 +1,25 @@
-import json
-import numpy as np
 from pathlib import Path
 
+from candidate_filters import CandidateFilter
+from embedding_store import load_store
+from scoring import ScoringEngine
+
 # === Load User Embeddings === #
-with open("data/users_with_embeddings.json", "r") as f:
-    users = json.load(f)
+user_store = load_store("users")
+users = user_store.records
 
 # === Load Product Embeddings === #
-with open("data/products_with_embeddings.json", "r") as f:
-    products = json.load(f)
+product_store = load_store("products")
+products = product_store.records
 
-# === Similarity Function === #
-def cosine_similarity(vec1, vec2):
-    vec1 = np.array(vec1, dtype=np.float32)
-    vec2 = np.array(vec2, dtype=np.float32)
-    return np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
+# === Scoring Engine === #
+engine = ScoringEngine.from_store(product_store)
+candidates = CandidateFilter().rows(engine)  # in-stock products only
 
 # === Recommendation Function === #
 def recommend_products_for_user(user, top_k=3):
-    user_embedding = user["embedding"]
-    scored_products = []
-
-    for product in products:
-        similarity = cosine_similarity(user_embedding, product["embedding"])
-        scored_products.append((product, similarity))
-
-    scored_products.sort(key=lambda x: x[1], reverse=True)
-    return scored_products[:top_k]
+    rows, scores = engine.top_k(user_store.vector(user["user_id"]), top_k, candidates=candidates)
+    return [(products[row], float(score)) for row, score in zip(rows[0], scores[0])]
 
 # === Run Recommendations === #
 for user in users:
@@ -0,0 +1,114 @@
+import json
+import os
+import sys
+from pathlib import Path
+
+# === Format === #
+# data/recommendations.jsonl, one user per line, best product first:
+#   {"user_id": 1, "name": "Aarav", "recommendations": [{"product_id": 2, "score": 0.81, "explanation": "..."}]}
+# Product details are not copied in; readers resolve product_id against the product store.
+BASE_DIR = Path(__file__).resolve().parent
+RECOMMENDATIONS_PATH = BASE_DIR / "data" / "recommendations.jsonl"
+LEGACY_RECOMMENDATIONS_PATH = BASE_DIR / "data" / "recommendations.json"
+
+
+def resolve_path(path=RECOMMENDATIONS_PATH):
+    # Fall back to the legacy JSON array until a JSON Lines file has been written
+    path = Path(path)
+    if not path.exists() and path == RECOMMENDATIONS_PATH and LEGACY_RECOMMENDATIONS_PATH.exists():
+        return LEGACY_RECOMMENDATIONS_PATH
+    return path
+
+
+def product_id_of(item):
+    # Legacy agent output embeds the whole product ("id"); everything else references it ("product_id")
+    return item.get("product_id", item.get("id"))
+
+
+def iter_recommendations(path=RECOMMENDATIONS_PATH):
+    """Yield one user entry at a time; only the legacy JSON array is read whole."""
+    path = resolve_path(path)
+    if path.suffix == ".json":
+        with open(path, "r") as f:
+            yield from json.load(f)
+        return
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_recommended_categories(path=RECOMMENDATIONS_PATH, product_categories=None):
+    """Yield (user_id, categories of the user's recommendations, best first), streaming the output.
+
+    ``product_categories`` maps product ID -> category; by default it is read from the product store.
+    """
+    if product_categories is None:
+        from embedding_store import load_store
+        product_categories = {product["id"]: product.get("category") for product in load_store("products").records}
+    for entry in iter_recommendations(path):
+        yield entry["user_id"], [product_categories.get(product_id_of(item)) for item in entry["recommendations"]]
+
+
+def slim_item(product_id, score=None, explanation=None):
+    item = {"product_id": product_id}
+    if score is not None:
+        item["score"] = round(float(score), 4)
+    if explanation is not None:
+        item["explanation"] = explanation
+    return item
+
+
+class RecommendationsWriter:
+    """Streams entries to ``<path>.tmp`` and renames it over ``path`` only if the block succeeds.
+
+        with RecommendationsWriter() as writer:
+            writer.write({"user_id": 1, "name": "Aarav", "recommendations": [...]})
+    """
+
+    def __init__(self, path=RECOMMENDATIONS_PATH):
+        self.path = Path(path)
+        self.tmp_path = self.path.with_name(self.path.name + ".tmp")
+        self.count = 0
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.tmp_path, "w")
+        return self
+
+    def write(self, entry):
+        self._file.write(json.dumps(entry) + "\n")
+        self.count += 1
+
+    def write_all(self, entries):
+        for entry in entries:
+            self.write(entry)
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self._file.close()
+            self.tmp_path.unlink(missing_ok=True)
+            return False
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+        return False
+
+
+def migrate_legacy(source=LEGACY_RECOMMENDATIONS_PATH, target=RECOMMENDATIONS_PATH):
+    with RecommendationsWriter(target) as writer:
+        for entry in iter_recommendations(source):
+            writer.write({
+                "user_id": entry["user_id"],
+                "name": entry.get("name"),
+                "recommendations": [
+                    slim_item(product_id_of(item), item.get("score"), item.get("explanation"))
+                    for item in entry.get("recommendations", [])
+                ],
+            })
+    print(f"✅ Wrote {writer.count} users to {target}")
+
+
+if __name__ == "__main__":
+    migrate_legacy(*sys.argv[1:])
@@ -0,0 +1,206 @@
+import numpy as np
+
+import profiling
+
+# Users are scored in blocks so the (users x products) score matrix stays bounded
+USER_BATCH_SIZE = 1024
+
+# Filtered ANN searches fetch this many times k (scaled by the share of allowed rows) before filtering
+SEARCH_OVERSAMPLE = 2
+
+
+def normalize_rows(vectors):
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def is_in_stock(product):
+    # Products without stock fields are assumed available
+    stock = product.get("stock")
+    return product.get("in_stock", True) is not False and (stock is None or stock > 0)
+
+
+def top_k_indices(scores, k):
+    # Row-wise top-k of a 2D score matrix, best first
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+class ScoringEngine:
+    """Product catalog held as one pre-normalized float32 matrix for batched cosine scoring."""
+
+    def __init__(self, products, embeddings=None, normalized=False, index=None):
+        self.products = products
+        # Optional ANN index (see ann_index.py) whose IDs are rows of this catalog
+        self.index = index
+        if embeddings is None:
+            embeddings = [product["embedding"] for product in products]
+        if normalized and getattr(embeddings, "dtype", None) == np.float32:
+            # Already unit rows (e.g. a memory-mapped store): score against it without copying
+            self.matrix = embeddings
+        else:
+            self.matrix = normalize_rows(embeddings)
+        self.ids = [product["id"] for product in products]
+        self.row_of = {product_id: row for row, product_id in enumerate(self.ids)}
+
+        self.categories = sorted({product.get("category") for product in products if product.get("category")})
+        category_code = {category: code for code, category in enumerate(self.categories)}
+        self.category_codes = np.array(
+            [category_code.get(product.get("category"), -1) for product in products], dtype=np.int32
+        )
+
+        # Catalog attributes candidate filters (candidate_filters.py) are built from
+        self.category_rows = {
+            category: np.flatnonzero(self.category_codes == code) for code, category in enumerate(self.categories)
+        }
+        self.prices = np.array(
+            [product["price"] if isinstance(product.get("price"), (int, float)) else np.nan for product in products],
+            dtype=np.float64,
+        )
+        self.in_stock = np.array([is_in_stock(product) for product in products], dtype=bool)
+
+    @classmethod
+    def from_store(cls, store, index=None):
+        return cls(store.records, store.vectors, normalized=store.normalized, index=index)
+
+    def __len__(self):
+        return len(self.products)
+
+    def rows_for(self, product_ids):
+        return [self.row_of[pid] for pid in product_ids if pid in self.row_of]
+
+    def score(self, vectors, rows=None):
+        # rows restricts scoring to those catalog rows (columns come back in that order)
+        if rows is None:
+            return normalize_rows(vectors) @ self.matrix.T
+        return normalize_rows(vectors) @ np.asarray(self.matrix[rows]).T
+
+    def score_pairs(self, vectors, rows):
+        """Score each query only against its own catalog rows (n_queries x m); row -1 scores -inf."""
+        rows = np.asarray(rows, dtype=np.int64)
+        scores = np.einsum("ij,ikj->ik", normalize_rows(vectors), np.asarray(self.matrix[np.maximum(rows, 0)]))
+        scores[rows < 0] = -np.inf
+        return scores
+
+    def max_similarity(self, rows, reference_rows):
+        """For each catalog row, its highest cosine similarity to any of ``reference_rows`` (-inf if none)."""
+        rows = np.asarray(rows, dtype=np.int64)
+        reference_rows = np.asarray(reference_rows, dtype=np.int64)
+        if not len(reference_rows):
+            return np.full(len(rows), -np.inf, dtype=np.float32)
+        # One (rows x references) product, max-pooled over the references
+        return (np.asarray(self.matrix[rows]) @ np.asarray(self.matrix[reference_rows]).T).max(axis=1)
+
+    def category_bias(self, preferred_categories, boost, rows=None):
+        # preferred_categories: one list of category names per query row
+        # rows: None for the whole catalog, 1D for the same rows per query, 2D for rows per query
+        preferred = np.zeros((len(preferred_categories), len(self.categories) + 1), dtype=np.float32)
+        category_code = {category: code for code, category in enumerate(self.categories)}
+        for row, categories in enumerate(preferred_categories):
+            for category in categories or []:
+                if category in category_code:
+                    preferred[row, category_code[category]] = boost
+        # Code -1 (no category) maps onto the trailing always-zero column
+        if rows is None:
+            return preferred[:, self.category_codes]
+        codes = self.category_codes[np.asarray(rows, dtype=np.int64)]
+        if codes.ndim == 1:
+            return preferred[:, codes]
+        return np.take_along_axis(preferred, codes, axis=1)
+
+    def top_k(self, vectors, k, bias=None, exclude=None, candidates=None):
+        """Return (rows, scores), each shaped (n_queries, k), best match first.
+
+        ``bias`` is added to the raw cosine scores (1D for all queries or 2D per query),
+        ``exclude`` is one iterable of catalog rows per query that must never be returned.
+        ``candidates`` (sorted catalog rows, e.g. CandidateFilter.rows) limits scoring to
+        those columns, so filtered-out rows never enter the matmul.
+        """
+        with profiling.stage("score", items=len(vectors)):
+            if candidates is None:
+                scores = self.score(vectors)
+            else:
+                candidates = np.asarray(candidates, dtype=np.int64)
+                scores = self.score(vectors, candidates)
+                if bias is not None and np.shape(bias)[-1] == len(self):
+                    bias = np.asarray(bias)[..., candidates]
+            if bias is not None:
+                scores = scores + bias
+            if exclude is not None:
+                for row, excluded_rows in enumerate(exclude):
+                    columns = np.asarray(list(excluded_rows), dtype=np.int64)
+                    if candidates is not None and len(columns):
+                        # Catalog rows -> candidate columns, dropping rows that are not candidates anyway
+                        columns = np.searchsorted(candidates, columns[np.isin(columns, candidates)])
+                    if len(columns):
+                        scores[row, columns] = -np.inf
+
+        with profiling.stage("sort", items=len(scores)):
+            rows = top_k_indices(scores, k)
+            top_scores = np.take_along_axis(scores, rows, axis=1)
+        if candidates is not None:
+            rows = candidates[rows]
+        return rows, top_scores
+
+    def search(self, vectors, k, nprobe=None, candidates=None):
+        """Unbiased top-k through the ANN index when one is attached, exact scan otherwise.
+
+        Missing slots (fewer than k candidates) come back as row -1 with score -inf.
+        With ``candidates`` the index is over-fetched and filtered; queries left with
+        fewer than k allowed rows are re-run as an exact scan over the candidates (as are
+        candidate sets small enough to scan directly).
+        """
+        if self.index is None:
+            return self._exact_search(vectors, k, candidates)
+        if candidates is None:
+            return self.index.search(vectors, k, nprobe=nprobe)
+
+        candidates = np.asarray(candidates, dtype=np.int64)
+        if len(candidates) <= self.index.brute_force_threshold:
+            # Few enough to scan exactly, as the index itself does for small catalogs
+            return self._exact_search(vectors, k, candidates)
+        allowed = np.zeros(len(self), dtype=bool)
+        allowed[candidates] = True
+        # Fetch enough that ~k allowed rows survive at the catalog's candidate density
+        fetch = min(len(self), int(np.ceil(k * SEARCH_OVERSAMPLE * len(self) / max(len(candidates), 1))))
+        found, found_scores = self.index.search(vectors, fetch, nprobe=nprobe)
+        keep = (found >= 0) & allowed[np.maximum(found, 0)]
+        # Allowed rows first, still best first, then cut to k
+        order = np.argsort(~keep, axis=1, kind="stable")[:, :k]
+        kept = np.take_along_axis(keep, order, axis=1)
+        rows = np.where(kept, np.take_along_axis(found, order, axis=1), -1)
+        scores = np.where(kept, np.take_along_axis(found_scores, order, axis=1), -np.inf).astype(np.float32)
+
+        short = np.flatnonzero(kept.sum(axis=1) < min(k, len(candidates)))
+        if len(short):
+            exact_rows, exact_scores = self._exact_search(np.asarray(vectors)[short], k, candidates)
+            rows[short], scores[short] = -1, -np.inf
+            rows[short, :exact_rows.shape[1]] = exact_rows
+            scores[short, :exact_scores.shape[1]] = exact_scores
+        return rows, scores
+
+    def _exact_search(self, vectors, k, candidates=None):
+        blocks = list(self.iter_top_k(normalize_rows(vectors), k, candidates=candidates))
+        return np.concatenate([rows for _, rows, _ in blocks]), np.concatenate([scores for _, _, scores in blocks])
+
+    def iter_top_k(self, vectors, k, bias_fn=None, exclude_fn=None, batch_size=USER_BATCH_SIZE, candidates=None):
+        """Score many queries in blocks; yields (start, rows, scores) per block."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        for start in range(0, len(vectors), batch_size):
+            stop = min(start + batch_size, len(vectors))
+            bias = bias_fn(start, stop) if bias_fn else None
+            exclude = exclude_fn(start, stop) if exclude_fn else None
+            rows, scores = self.top_k(vectors[start:stop], k, bias=bias, exclude=exclude, candidates=candidates)
+            yield start, rows, scores
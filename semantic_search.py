@@ -1,63 +1,89 @@
-import json
-import numpy as np
-import requests
-
-# === Constants === #
-EMBEDDING_SIZE = 768  # Match generate_embeddings.py
-OLLAMA_EMBEDDING_URL = "http://localhost:11434/api/embeddings"
-MODEL_NAME = "nomic-embed-text"
-
-# === Embedding Function === #
-def get_embedding(text, max_retries=3):
-    for attempt in range(max_retries):
-        try:
-            response = requests.post(OLLAMA_EMBEDDING_URL, json={
-                "model": MODEL_NAME,
-                "prompt": text
-            })
-            data = response.json()
-            embedding = data.get("embedding", [])
-
-            if isinstance(embedding, list) and len(embedding) == EMBEDDING_SIZE:
-                return np.array(embedding, dtype=np.float32)
-            else:
-                print(f"⚠️ Attempt {attempt + 1}: Invalid embedding length ({len(embedding)}). Retrying...")
-
-        except Exception as e:
-            print(f"❌ Exception on attempt {attempt + 1}: {e}")
-
-    print("❌ Failed to get a valid embedding after retries.")
-    return None
-
-# === Similarity Calculation === #
-def cosine_similarity(vec1, vec2):
-    dot = np.dot(vec1, vec2)
-    norm1 = np.linalg.norm(vec1)
-    norm2 = np.linalg.norm(vec2)
-    return dot / (norm1 * norm2)
+import time
+
+from ann_index import load_store_index
+from embedding_client import EmbeddingClient
+from embedding_store import load_store, store_path
+from lru_cache import LRUCache
+from scoring import ScoringEngine
+
+# === Embedding Client === #
+client = EmbeddingClient()
+
+# === Caches === #
+QUERY_CACHE_SIZE = 10000      # query text -> embedding
+QUERY_CACHE_TTL = None        # seconds; None keeps entries until evicted
+RESULT_CACHE_SIZE = 1000      # hottest (query, top_k, nprobe) -> results
+STORE_CHECK_INTERVAL = 5.0    # seconds between product store change checks
+
+query_cache = LRUCache(QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+result_cache = LRUCache(RESULT_CACHE_SIZE)
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+# === Product Catalog === #
+_engine = None
+_store_version = None
+_last_store_check = 0.0
+
+def _manifest_mtime():
+    manifest_file = store_path("products") / "manifest.json"
+    return manifest_file.stat().st_mtime_ns if manifest_file.exists() else None
+
+def get_engine():
+    # Build the normalized product matrix once, and again whenever the store is rewritten
+    global _engine, _store_version, _last_store_check
+    now = time.monotonic()
+    if _engine is not None and now - _last_store_check < STORE_CHECK_INTERVAL:
+        return _engine
+    _last_store_check = now
+
+    version = _manifest_mtime()
+    if _engine is None or version != _store_version:
+        store = load_store("products")
+        _engine = ScoringEngine.from_store(store, index=load_store_index("products", store))
+        _store_version = version
+        # Cached results point at rows of the old store
+        result_cache.clear()
+    return _engine
+
+def embed_query(query):
+    key = (client.model, normalize_query(query))
+    embedding = query_cache.get(key)
+    if embedding is None:
+        embedding = client.embed(key[1])
+        if embedding is not None:
+            query_cache.put(key, embedding)
+    return embedding
 
 # === Semantic Search === #
-def semantic_search(query, top_k=3):
-    # Load product embeddings
-    with open("data/products_with_embeddings.json", "r") as f:
-        products = json.load(f)
+def semantic_search(query, top_k=3, nprobe=None):
+    engine = get_engine()
+
+    cache_key = (normalize_query(query), top_k, nprobe)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return cached
 
-    # Embed the search query
-    query_embedding = get_embedding(query)
+    # Embed the search query (served from the LRU for repeat queries)
+    query_embedding = embed_query(query)
     if query_embedding is None:
         print("❌ Failed to get embedding for query.")
         return []
 
-    # Calculate similarity for each product
-    results = []
-    for product in products:
-        prod_embedding = np.array(product["embedding"], dtype=np.float32)
-        similarity = cosine_similarity(query_embedding, prod_embedding)
-        results.append((product, similarity))
+    # ANN lookup (exact scan for small catalogs); nprobe trades recall for latency
+    rows, scores = engine.search(query_embedding, top_k, nprobe=nprobe)
+    results = [(engine.products[row], float(score)) for row, score in zip(rows[0], scores[0]) if row >= 0]
+    result_cache.put(cache_key, results)
+    return results
+
+def warm_result_cache(queries, top_k=3):
+    # Precompute results for known hot queries (e.g. yesterday's top searches)
+    for query in queries:
+        semantic_search(query, top_k=top_k)
 
-    # Sort results by similarity
-    results.sort(key=lambda x: x[1], reverse=True)
-    return results[:top_k]
+def cache_stats():
+    return {"query_embeddings": query_cache.stats(), "results": result_cache.stats()}
 
 # === Run the Search === #
 if __name__ == "__main__":
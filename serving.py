@@ -0,0 +1,307 @@
+import gzip
+import hashlib
+import heapq
+import json
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from embedding_store import load_store, store_path
+from item_neighbors import load_neighbors
+from lru_cache import LRUCache
+from metrics import stage
+from recommendations_io import RECOMMENDATIONS_PATH, iter_recommendations, product_id_of, resolve_path
+
+PRODUCT_MANIFEST_PATH = store_path("products") / "manifest.json"
+NEIGHBORS_META_PATH = store_path("products") / "neighbors.json"
+
+RELOAD_INTERVAL = 10.0  # seconds between artifact checks
+
+# Serialized /api/recommendations bodies kept per snapshot
+BODY_CACHE_SIZE = 100000
+
+# Per-item fields kept from the recommendations output besides the product itself
+ITEM_EXTRA_FIELDS = ("score", "explanation")
+
+RECOMMENDATIONS_MESSAGE = "✅ Recommendations fetched from recommendations.json"
+
+# /api/products paging
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+PAGE_CACHE_SIZE = 1024
+
+# /api/products/<id>/similar
+DEFAULT_SIMILAR = 10
+SIMILAR_CACHE_SIZE = 50000
+
+
+class CachedBody:
+    """A serialized JSON response with its ETag and a lazily built gzip variant.
+
+    The gzip variant is a different representation, so it gets its own strong ETag.
+    """
+
+    def __init__(self, payload):
+        with stage("serialize"):
+            self.raw = json.dumps(payload).encode("utf-8")
+        self.etag = hashlib.sha1(self.raw).hexdigest()
+        self.gzip_etag = f"{self.etag}-gzip"
+        self._gzipped = None
+
+    @property
+    def gzipped(self):
+        if self._gzipped is None:
+            with stage("compress"):
+                self._gzipped = gzip.compress(self.raw, compresslevel=6)
+        return self._gzipped
+
+
+class ServingSnapshot:
+    """Read-only, ID-indexed view of the products and precomputed recommendations the API serves.
+
+    Recommendations are kept as product-ID tuples resolved against one shared product
+    table, and each user's response body is serialized once and reused.
+    """
+
+    def __init__(self, products, recommendations, version=None, product_vectors=None, neighbors=None):
+        self.version = version
+        self.loaded_at = datetime.utcnow().isoformat()
+        self.load_seconds = None
+        self.products = products
+        # Row-aligned with products (memory-mapped store); only read for fields=embedding
+        self.product_vectors = product_vectors
+        # Precomputed item-item table (item_neighbors.py), row-aligned with products
+        self.neighbors = neighbors
+        self._similar = LRUCache(SIMILAR_CACHE_SIZE)
+        self.product_fields = {key for product in products for key in product}
+        self._pages = LRUCache(PAGE_CACHE_SIZE)
+        self.products_by_id = {product["id"]: product for product in products}
+        self.row_by_id = {product["id"]: row for row, product in enumerate(products)}
+        # Category -> catalog rows, in catalog order
+        self.rows_by_category = {}
+        for row, product in enumerate(products):
+            self.rows_by_category.setdefault(product.get("category"), []).append(row)
+        self.recommendation_ids = {}
+        self.recommendation_extras = {}
+        for entry in recommendations:
+            self._index_user(entry)
+        self._bodies = LRUCache(BODY_CACHE_SIZE)
+
+    def _index_user(self, entry):
+        user_id = entry["user_id"]
+        product_ids = []
+        extras = {}
+        for item in entry.get("recommendations", []):
+            product_id = product_id_of(item)
+            if product_id is None:
+                continue
+            product_ids.append(product_id)
+            item_extras = {field: item[field] for field in ITEM_EXTRA_FIELDS if field in item}
+            if item_extras:
+                extras[product_id] = item_extras
+        self.recommendation_ids[user_id] = tuple(product_ids)
+        if extras:
+            self.recommendation_extras[user_id] = extras
+
+    def caches(self):
+        # Per-snapshot response caches, for /metrics
+        return {"recommendation_bodies": self._bodies, "product_pages": self._pages, "similar": self._similar}
+
+    def has_recommendations(self, user_id):
+        return user_id in self.recommendation_ids
+
+    def resolve_recommendations(self, user_id):
+        extras = self.recommendation_extras.get(user_id, {})
+        resolved = []
+        for product_id in self.recommendation_ids.get(user_id, ()):
+            product = self.products_by_id.get(product_id)
+            if product is None:
+                continue  # dropped from the catalog since the batch ran
+            if product_id in extras:
+                product = {**product, **extras[product_id]}
+            resolved.append(product)
+        return resolved
+
+    def recommendations_body(self, user_id):
+        """Pre-serialized JSON response for a user, or None if the batch has nothing for them."""
+        if user_id not in self.recommendation_ids:
+            return None
+        body = self._bodies.get(user_id)
+        if body is None:
+            recommendations = self.resolve_recommendations(user_id)
+            with stage("serialize"):
+                body = json.dumps({
+                    "message": RECOMMENDATIONS_MESSAGE,
+                    "recommendations": recommendations,
+                }).encode("utf-8")
+            self._bodies.put(user_id, body)
+        return body
+
+    def products_in_categories(self, categories, exclude_ids=(), limit=10):
+        """First ``limit`` products (catalog order) in any of ``categories``, skipping ``exclude_ids``."""
+        rows = heapq.merge(*(self.rows_by_category.get(category, []) for category in set(categories)))
+        found = []
+        for row in rows:
+            product = self.products[row]
+            if product.get("id") in exclude_ids:
+                continue
+            found.append(product)
+            if len(found) == limit:
+                break
+        return found
+
+    def similar_body(self, product_id, limit=DEFAULT_SIMILAR):
+        """Cached body listing the products most similar to ``product_id``; None if it is unknown."""
+        row = self.row_by_id.get(product_id)
+        if row is None:
+            return None
+        key = (product_id, limit)
+        body = self._similar.get(key)
+        if body is None:
+            similar = []
+            if self.neighbors is not None:
+                rows, scores = self.neighbors.similar(row, limit)
+                similar = [
+                    {**self.products[neighbor_row], "score": round(float(score), 4)}
+                    for neighbor_row, score in zip(rows.tolist(), scores)
+                ]
+            body = CachedBody({"product_id": product_id, "similar": similar})
+            self._similar.put(key, body)
+        return body
+
+    def products_page(self, offset=0, limit=DEFAULT_PAGE_SIZE, fields=None):
+        """Cached body for one page of the catalog; ``fields`` projects each product (ID always kept)."""
+        fields = tuple(sorted(set(fields) | {"id"})) if fields else None
+        key = (offset, limit, fields)
+        page = self._pages.get(key)
+        if page is None:
+            rows = range(offset, min(offset + limit, len(self.products)))
+            items = []
+            for row in rows:
+                product = self.products[row]
+                if fields is not None:
+                    product = {field: product[field] for field in fields if field in product}
+                    if "embedding" in fields and self.product_vectors is not None:
+                        product["embedding"] = self.product_vectors[row].tolist()
+                items.append(product)
+            next_offset = offset + limit if offset + limit < len(self.products) else None
+            page = CachedBody({
+                "products": items,
+                "total": len(self.products),
+                "offset": offset,
+                "limit": limit,
+                "next_offset": next_offset,
+            })
+            self._pages.put(key, page)
+        return page
+
+
+# ------------------- Loading & Hot Reload -------------------
+
+def _file_stamp(path):
+    try:
+        stat = Path(path).stat()
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+    except FileNotFoundError:
+        return "missing"
+
+
+def artifact_version(recommendations_path=RECOMMENDATIONS_PATH):
+    # Changes whenever the product store or the recommendations file is rewritten
+    recommendations_path = resolve_path(recommendations_path)
+    return (
+        f"products:{_file_stamp(PRODUCT_MANIFEST_PATH)}|neighbors:{_file_stamp(NEIGHBORS_META_PATH)}"
+        f"|recommendations:{_file_stamp(recommendations_path)}"
+    )
+
+
+def load_snapshot(recommendations_path=RECOMMENDATIONS_PATH, strict=False):
+    # strict=True raises on unreadable artifacts instead of serving empty data
+    started = time.perf_counter()
+    version = artifact_version(recommendations_path)
+    try:
+        with stage("load"):
+            product_store = load_store("products")
+            products, product_vectors = product_store.records, product_store.vectors
+            neighbors = load_neighbors("products", product_store)
+    except Exception as e:
+        if strict:
+            raise
+        print(f"❌ Error loading products file: {e}")
+        products, product_vectors, neighbors = [], None, None
+
+    try:
+        # Indexed line by line; the parsed entries are not kept
+        with stage("index"):
+            snapshot = ServingSnapshot(products, iter_recommendations(recommendations_path), version=version,
+                                       product_vectors=product_vectors, neighbors=neighbors)
+    except Exception as e:
+        if strict:
+            raise
+        print(f"❌ Error loading recommendations file: {e}")
+        snapshot = ServingSnapshot(products, [], version=version, product_vectors=product_vectors,
+                                   neighbors=neighbors)
+    snapshot.load_seconds = round(time.perf_counter() - started, 3)
+    return snapshot
+
+
+class SnapshotWatcher:
+    """Polls the serving artifacts and swaps in a freshly loaded snapshot when they change.
+
+    Loading and indexing happen on the watcher thread; request handlers only read
+    ``current``, which is replaced by a single reference assignment.
+    """
+
+    def __init__(self, recommendations_path=RECOMMENDATIONS_PATH, interval=RELOAD_INTERVAL):
+        self.recommendations_path = recommendations_path
+        self.interval = interval
+        self.current = load_snapshot(recommendations_path)
+        self.reloads = 0
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="snapshot-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def check(self):
+        version = artifact_version(self.recommendations_path)
+        if version == self.current.version:
+            return False
+        try:
+            snapshot = load_snapshot(self.recommendations_path, strict=True)
+        except Exception as e:
+            # Most likely a half-written artifact; keep serving the old snapshot and retry
+            self.last_error = str(e)
+            print(f"⚠️ Snapshot reload failed, keeping version {self.current.version}: {e}")
+            return False
+        self.current = snapshot
+        self.reloads += 1
+        self.last_error = None
+        print(f"🔄 Loaded serving snapshot {snapshot.version}")
+        return True
+
+    def health(self):
+        snapshot = self.current
+        return {
+            "status": "ok",
+            "snapshot_version": snapshot.version,
+            "loaded_at": snapshot.loaded_at,
+            "load_seconds": snapshot.load_seconds,
+            "products": len(snapshot.products),
+            "users_with_recommendations": len(snapshot.recommendation_ids),
+            "neighbor_table": snapshot.neighbors is not None,
+            "reloads": self.reloads,
+            "last_reload_error": self.last_error,
+        }